@@ -0,0 +1,279 @@
+from collections import defaultdict
+from django.core.cache import caches
+from django.db.models import BigIntegerField, Case, Max, When
+from pretix.base.models import Event, OrderPayment, OrderPosition
+
+from .chart import (
+    COUNTED_PAYMENT_STATES, LOCK_TIMEOUT, build_chart_and_text, get_cents,
+    get_date_range, get_day, get_end_date, get_generations, get_hour,
+    get_hours, get_resolution, get_start_date, store_chart_and_text,
+    store_daily_totals, store_snapshot,
+)
+from .config import get_config
+from .payload import divide
+from .utils import get_cache_key, get_fresh_cache_key, get_organizer_queued_key
+
+
+def get_stretchgoals_events(organizer=None):
+    """Return all events that have the stretch goals plugin enabled."""
+    qs = Event.objects.filter(
+        plugins__regex=r"(^|,)pretix_stretchgoals(,|$)"
+    ).select_related("organizer")
+    if organizer:
+        qs = qs.filter(organizer=organizer)
+    return qs
+
+
+def get_organizer_events(request):
+    """Return the events of the current organizer whose stretch goals the user may see."""
+    return get_stretchgoals_events(request.organizer).filter(
+        pk__in=request.user.get_events_with_permission(
+            "can_view_orders", request=request
+        ).values("pk")
+    )
+
+
+def get_batch_payment_dates(event_ids):
+    """Like chart.get_payment_dates, but for the orders of several events at once."""
+    return dict(
+        OrderPayment.objects.filter(
+            order__event_id__in=event_ids,
+            state__in=COUNTED_PAYMENT_STATES,
+            payment_date__isnull=False,
+        )
+        .order_by()
+        .values("order")
+        .annotate(last_payment_date=Max("payment_date"))
+        .values_list("order", "last_payment_date")
+        .iterator()
+    )
+
+
+def get_day_buckets():
+    """Return a dict collecting [count, cents] per day."""
+    return defaultdict(lambda: [0, 0])
+
+
+def get_batch_cents(configs):
+    """Database expression for the price in cents, in the currency of each event."""
+    event_ids = defaultdict(list)
+    for pk, config in configs.items():
+        event_ids[config.places].append(pk)
+    if len(event_ids) == 1:
+        return get_cents("price", next(iter(event_ids)))
+    return Case(
+        *[
+            When(order__event_id__in=pks, then=get_cents("price", places))
+            for places, pks in event_ids.items()
+        ],
+        output_field=BigIntegerField(),
+    )
+
+
+def get_batch_stats(configs):
+    """
+    Compute the sale stats and the per-day buckets of several events in a single
+    pass over their positions. The positions of all events are fetched with one
+    query and partitioned by event, applying every event's own item filter and
+    pending setting from the given {event id: ChartConfig} dict. Returns a dict
+    mapping event ids to (stats, buckets, breakdown buckets, hour buckets). The
+    breakdown buckets are None unless the breakdown is enabled, the hour buckets
+    unless the chart may have an hourly resolution.
+    """
+    result = {
+        pk: (
+            {"first": None, "last": None, "count": 0, "total": 0},
+            get_day_buckets(),
+            {
+                "items": defaultdict(get_day_buckets),
+                "subevents": defaultdict(get_day_buckets),
+            }
+            if config.breakdown
+            else None,
+            get_day_buckets() if config.resolution in ("hour", "auto") else None,
+        )
+        for pk, config in configs.items()
+    }
+    if not configs:
+        return result
+
+    paid_event_ids = [
+        pk for pk, config in configs.items() if not config.include_pending
+    ]
+    payment_dates = get_batch_payment_dates(paid_event_ids) if paid_event_ids else {}
+    allowed_states = ["p", "n"] if len(paid_event_ids) < len(configs) else ["p"]
+    positions = (
+        OrderPosition.objects.filter(
+            order__event_id__in=list(configs), order__status__in=allowed_states
+        )
+        .order_by()
+        .annotate(cents=get_batch_cents(configs))
+        .values_list(
+            "order__event_id",
+            "order_id",
+            "order__status",
+            "order__datetime",
+            "item_id",
+            "subevent_id",
+            "cents",
+        )
+    )
+    for (
+        event_id,
+        order_id,
+        status,
+        order_datetime,
+        item_id,
+        subevent_id,
+        cents,
+    ) in positions.iterator():
+        config = configs[event_id]
+        include_pending = config.include_pending
+        if (status == "n" and not include_pending) or (
+            config.items and item_id not in config.items
+        ):
+            continue
+        stats, buckets, breakdown, hours = result[event_id]
+        stats["count"] += 1
+        stats["total"] += cents
+        timestamp = order_datetime if include_pending else payment_dates.get(order_id)
+        if timestamp is None:
+            continue
+        if stats["first"] is None or timestamp < stats["first"]:
+            stats["first"] = timestamp
+        if stats["last"] is None or timestamp > stats["last"]:
+            stats["last"] = timestamp
+        day = get_day(timestamp, config.timezone)
+        bucket = buckets[day]
+        bucket[0] += 1
+        bucket[1] += cents
+        if hours is not None:
+            bucket = hours[get_hour(timestamp, config.timezone)]
+            bucket[0] += 1
+            bucket[1] += cents
+        if breakdown is not None:
+            for kind, pk in (("items", item_id), ("subevents", subevent_id)):
+                if pk is not None:
+                    bucket = breakdown[kind][pk][day]
+                    bucket[0] += 1
+                    bucket[1] += cents
+
+    for stats, buckets, breakdown, hours in result.values():
+        stats["average"] = (
+            divide(stats["total"], stats["count"]) if stats["count"] else 0
+        )
+    return result
+
+
+def get_variants(event):
+    """Return the cache variants of an event: public ones also have a public chart."""
+    return (False, True) if event.settings.stretchgoals_is_public else (False,)
+
+
+def get_variant_totals(days, buckets, breakdown):
+    """
+    Turn the per-day buckets of get_batch_stats into the daily totals and
+    breakdown format of chart.get_daily_totals and chart.get_breakdown_totals.
+    """
+    daily_totals = [(day, *buckets.get(day, (0, 0))) for day in days]
+    if breakdown is None:
+        return daily_totals, None
+    return daily_totals, {
+        kind: {
+            pk: (
+                [by_day[day][0] if day in by_day else 0 for day in days],
+                [by_day[day][1] if day in by_day else 0 for day in days],
+            )
+            for pk, by_day in series.items()
+            if any(day in by_day for day in days)
+        }
+        for kind, series in breakdown.items()
+    }
+
+
+def refresh_events(events):
+    """
+    Regenerate and store the chart data of all given events in one pass, e.g.
+    for all events of an organizer, including the public variant of public
+    events. Unlike refresh_chart_and_text, the data is always regenerated.
+    Returns a dict mapping events to their new (backend) chart data.
+    """
+    events = list(events)
+    configs = {event.pk: get_config(event) for event in events}
+    generations = get_generations(configs)
+    batch_stats = get_batch_stats(configs)
+    results = {}
+    for event in events:
+        config = configs[event.pk]
+        stats, buckets, breakdown, hours = batch_stats[event.pk]
+        start_date = get_start_date(config, stats)
+        for public in get_variants(event):
+            end_date = get_end_date(config, stats, public=public)
+            # The breakdown is only shown in the backend
+            daily_totals, variant_breakdown = get_variant_totals(
+                list(get_date_range(start_date, end_date)),
+                buckets,
+                None if public else breakdown,
+            )
+            hourly_totals = None
+            if hours is not None and get_resolution(config, start_date, end_date) == "hour":
+                hourly_totals = [
+                    (hour, *hours.get(hour, (0, 0)))
+                    for hour in get_hours(start_date, end_date)
+                ]
+            if not public:
+                store_daily_totals(event, config, daily_totals, generations[event.pk])
+                store_snapshot(event, config, stats, daily_totals)
+            chart_data = build_chart_and_text(
+                event,
+                config,
+                stats,
+                daily_totals,
+                breakdown=variant_breakdown,
+                hourly_totals=hourly_totals,
+            )
+            store_chart_and_text(event, chart_data, public=public)
+            if not public:
+                results[event] = chart_data
+    return results
+
+
+def get_cached_chart_data(events):
+    """
+    Return a dict mapping the given events to their cached backend chart data,
+    and the list of events whose data (of any variant) is missing or outdated.
+    Nothing is regenerated.
+    """
+    results = {}
+    outdated = []
+    for event in events:
+        keys = {
+            public: (get_cache_key(event, public), get_fresh_cache_key(event, public))
+            for public in get_variants(event)
+        }
+        cached = event.cache.get_many([key for pair in keys.values() for key in pair])
+        results[event] = cached.get(keys[False][0])
+        if not all(cached.get(fresh_key) for data_key, fresh_key in keys.values()):
+            outdated.append(event)
+    return results, outdated
+
+
+def schedule_organizer_refresh(organizer, events=None):
+    """
+    Queue a background regeneration of the chart data of the given events of an
+    organizer, or of all of its events. Nothing is queued if a regeneration is
+    queued for the organizer already. Returns whether a task was queued.
+    """
+    from .tasks import refresh_organizer_chart_data
+
+    if not caches["default"].add(
+        get_organizer_queued_key(organizer), True, timeout=LOCK_TIMEOUT
+    ):
+        return False
+    refresh_organizer_chart_data.apply_async(
+        args=(organizer.pk,),
+        kwargs={
+            "event_ids": [event.pk for event in events] if events is not None else None
+        },
+    )
+    return True
@@ -0,0 +1,210 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection
+from django.db.models import DateTimeField, Max, OuterRef, Subquery
+from django.test.utils import CaptureQueriesContext
+from django.utils.crypto import get_random_string
+from django.utils.timezone import now
+from pretix.base.models import (
+    Event, Order, OrderPayment, OrderPosition, Organizer,
+)
+from time import perf_counter
+
+from .chart import (
+    compute_chart_and_text, get_chart_and_text, refresh_chart_and_text,
+)
+from .models import DailyTotal, Snapshot
+from .utils import set_goals
+
+BATCH_SIZE = 2000
+
+
+def create_synthetic_event(
+    orders=40000,
+    positions_per_order=3,
+    days=120,
+    payment_spread=3,
+    items=3,
+    pending_share=0.2,
+    seed=42,
+):
+    """
+    Create an organizer and an event with the given number of orders, spread
+    over the last ``days`` days, with ``positions_per_order`` positions per
+    order on average. Paid orders are paid up to ``payment_spread`` days after
+    they have been placed. Meant to be used in a transaction that is rolled
+    back afterwards, or to be deleted with loadtest.delete_synthetic_event.
+    """
+    rnd = random.Random(seed)
+    slug = "stretchgoals-benchmark-{}".format(get_random_string(8).lower())
+    organizer = Organizer.objects.create(name="Stretchgoals Benchmark", slug=slug)
+    event = Event.objects.create(
+        organizer=organizer,
+        name="Stretchgoals Benchmark",
+        slug="benchmark",
+        date_from=now() + timedelta(days=30),
+        plugins="pretix_stretchgoals",
+    )
+    event.settings.timezone = "Europe/Berlin"
+    event_items = [
+        event.items.create(name="Item {}".format(i + 1), default_price=10 * (i + 1))
+        for i in range(items)
+    ]
+    sales_channel = organizer.sales_channels.get(identifier="web")
+    start = now() - timedelta(days=days)
+
+    for batch_start in range(0, orders, BATCH_SIZE):
+        batch = []
+        for index in range(batch_start, min(batch_start + BATCH_SIZE, orders)):
+            placed = start + timedelta(seconds=rnd.randint(0, days * 24 * 3600))
+            batch.append(
+                Order(
+                    organizer=organizer,
+                    event=event,
+                    code="B{:08d}".format(index),
+                    status=(
+                        Order.STATUS_PENDING
+                        if rnd.random() < pending_share
+                        else Order.STATUS_PAID
+                    ),
+                    datetime=placed,
+                    expires=placed + timedelta(days=14),
+                    total=Decimal("0.00"),
+                    email="benchmark@example.org",
+                    sales_channel=sales_channel,
+                )
+            )
+        Order.objects.bulk_create(batch)
+
+    order_rows = Order.objects.filter(event=event).values_list(
+        "pk", "status", "datetime"
+    )
+    positions = []
+    payments = []
+    for order_id, status, placed in order_rows.iterator():
+        total = Decimal("0.00")
+        for positionid in range(1, rnd.randint(1, positions_per_order * 2 - 1) + 1):
+            price = Decimal(rnd.randint(500, 10000)) / 100
+            total += price
+            positions.append(
+                OrderPosition(
+                    organizer=organizer,
+                    order_id=order_id,
+                    positionid=positionid,
+                    item=rnd.choice(event_items),
+                    price=price,
+                    tax_rate=Decimal("0.00"),
+                    tax_value=Decimal("0.00"),
+                    secret=get_random_string(32),
+                    pseudonymization_id=get_random_string(16),
+                )
+            )
+        if status == Order.STATUS_PAID:
+            payments.append(
+                OrderPayment(
+                    order_id=order_id,
+                    local_id=1,
+                    amount=total,
+                    provider="manual",
+                    state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+                    payment_date=min(
+                        placed
+                        + timedelta(seconds=rnd.randint(0, payment_spread * 24 * 3600)),
+                        now(),
+                    ),
+                )
+            )
+        if len(positions) >= BATCH_SIZE:
+            OrderPosition.objects.bulk_create(positions)
+            positions = []
+        if len(payments) >= BATCH_SIZE:
+            OrderPayment.objects.bulk_create(payments)
+            payments = []
+    OrderPosition.objects.bulk_create(positions)
+    OrderPayment.objects.bulk_create(payments)
+    return event
+
+
+def get_legacy_range_queryset(event, start_dt, end_dt):
+    """
+    The paid-orders range query as it was built before payment dates were
+    resolved per order: a correlated subquery evaluated for every position.
+    """
+    op_date = (
+        OrderPayment.objects.filter(
+            order=OuterRef("order"),
+            state__in=(
+                OrderPayment.PAYMENT_STATE_CONFIRMED,
+                OrderPayment.PAYMENT_STATE_REFUNDED,
+            ),
+            payment_date__isnull=False,
+        )
+        .order_by()
+        .values("order")
+        .annotate(m=Max("payment_date"))
+        .values("m")
+    )
+    return (
+        OrderPosition.objects.filter(order__event=event, order__status="p")
+        .annotate(payment_date=Subquery(op_date, output_field=DateTimeField()))
+        .filter(payment_date__gte=start_dt, payment_date__lte=end_dt)
+        .order_by()
+    )
+
+
+def timed(function, *args, **kwargs):
+    """Return the result of the function call and its duration in seconds."""
+    started = perf_counter()
+    result = function(*args, **kwargs)
+    return result, perf_counter() - started
+
+
+def measure(function, *args, **kwargs):
+    """Return the result of the function call, its duration and its query count."""
+    with CaptureQueriesContext(connection) as queries:
+        result, duration = timed(function, *args, **kwargs)
+    return result, duration, len(queries.captured_queries)
+
+
+def configure_event(event, include_pending=False, filter_items=0, goals=3):
+    """Enable both charts, and set up goals and the item filter."""
+    event.settings.stretchgoals_chart_averages = True
+    event.settings.stretchgoals_chart_totals = True
+    event.settings.stretchgoals_include_pending = include_pending
+    if filter_items:
+        event.settings.stretchgoals_items = ",".join(
+            str(pk) for pk in event.items.values_list("pk", flat=True)[:filter_items]
+        )
+    set_goals(
+        event,
+        [
+            {
+                "name": {"en": "Goal {}".format(i + 1)},
+                "description": {"en": ""},
+                "total": 100000 * (i + 1),
+                "amount": 5000 * (i + 1),
+            }
+            for i in range(goals)
+        ],
+    )
+
+
+def run_benchmark(event):
+    """
+    Time the chart generation of an event with an empty rollup table (cold),
+    with a filled rollup table (warm), and when served from the cache (cached).
+    Returns a dict of (duration, query count) tuples.
+    """
+    DailyTotal.objects.filter(event=event).delete()
+    Snapshot.objects.filter(event=event).delete()
+    event.cache.clear()
+    results = {}
+    event.settings.flush()
+    results["cold"] = measure(compute_chart_and_text, event)[1:]
+    event.settings.flush()
+    results["warm"] = measure(compute_chart_and_text, event)[1:]
+    refresh_chart_and_text(event, force=True)
+    event.settings.flush()
+    results["cached"] = measure(get_chart_and_text, event)[1:]
+    return results
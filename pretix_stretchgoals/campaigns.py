@@ -0,0 +1,187 @@
+"""
+Campaigns combine the revenue of several events of an organizer towards shared
+goals, e.g. a conference and its workshops. Their chart data is computed from
+the per-day buckets of batch.get_batch_stats, so all events of a campaign are
+covered by the same two queries, and stored once per campaign in the cache of
+the organizer.
+"""
+import hashlib
+import json
+from dataclasses import replace
+from django.core.cache import caches
+from i18nfield.strings import LazyI18nString
+
+from .batch import (
+    get_batch_stats, get_day_buckets, get_stretchgoals_events,
+    get_variant_totals,
+)
+from .chart import (
+    LOCK_TIMEOUT, STALE_TIMEOUT, build_chart_and_text, get_cache_timeout,
+    get_date_range, get_end_date, get_start_date,
+)
+from .config import get_config
+from .profiling import phase
+from .utils import (
+    CACHE_SCHEMA_VERSION, get_cache_version, get_campaign_cache_key,
+    get_campaign_fresh_key, get_campaign_lock_key, get_campaign_queued_key,
+    get_campaigns,
+)
+
+
+def get_campaign(organizer, campaign_id):
+    return next(
+        (
+            campaign
+            for campaign in get_campaigns(organizer)
+            if campaign["id"] == campaign_id
+        ),
+        None,
+    )
+
+
+def get_campaign_events(organizer, campaign):
+    """Return the events of a campaign, the last one being the latest event."""
+    return list(
+        get_stretchgoals_events(organizer)
+        .filter(pk__in=campaign["events"])
+        .order_by("date_from", "pk")
+    )
+
+
+def get_campaign_config(campaign, config):
+    """
+    Derive the config of a campaign chart from the config of one of its events,
+    which provides the currency and the timezone.
+    """
+    return replace(
+        config,
+        items=(),
+        breakdown=False,
+        chart_averages=True,
+        chart_totals=True,
+        resolution="day",
+        start_date=None,
+        end_date=None,
+        min_orders=None,
+        forecast=True,
+        static_charts=False,
+        public_text=LazyI18nString(""),
+        goals=tuple(campaign["goals"]),
+    )
+
+
+def get_campaign_version(campaign, events):
+    """
+    Like utils.get_cache_version, for the definition of a campaign and the
+    settings of all of its events.
+    """
+    values = [
+        CACHE_SCHEMA_VERSION,
+        campaign["id"],
+        json.dumps([goal["total"] for goal in campaign["goals"]]),
+    ] + [get_cache_version(event) for event in events]
+    return hashlib.sha1(json.dumps(values).encode()).hexdigest()[:16]
+
+
+def compute_campaign(campaign, events, profile=None):
+    """
+    Compute the chart data of a campaign. Every event contributes the days of
+    its own range, with its own item filter and pending setting.
+    """
+    with phase(profile, "settings"):
+        configs = {event.pk: get_config(event) for event in events}
+    with phase(profile, "stats"):
+        batch_stats = get_batch_stats(configs)
+    with phase(profile, "daily totals"):
+        stats = {"count": 0, "total": 0}
+        buckets = get_day_buckets()
+        start_date = end_date = None
+        for event in events:
+            config = configs[event.pk]
+            event_stats, event_buckets = batch_stats[event.pk][:2]
+            event_start = get_start_date(config, event_stats)
+            event_end = get_end_date(config, event_stats)
+            for day, count, total in get_variant_totals(
+                list(get_date_range(event_start, event_end)), event_buckets, None
+            )[0]:
+                buckets[day][0] += count
+                buckets[day][1] += total
+            stats["count"] += event_stats["count"]
+            stats["total"] += event_stats["total"]
+            start_date = min(start_date or event_start, event_start)
+            end_date = max(end_date or event_end, event_end)
+        daily_totals = get_variant_totals(
+            list(get_date_range(start_date, end_date)), buckets, None
+        )[0]
+    # The forecast runs up to the date of the latest event
+    last_event = events[-1]
+    return build_chart_and_text(
+        last_event,
+        get_campaign_config(campaign, configs[last_event.pk]),
+        stats,
+        daily_totals,
+        profile=profile,
+    )
+
+
+def get_campaign_data(organizer, campaign, events):
+    """
+    Return the stored chart data of a campaign, or None if it has not been
+    generated yet. Like chart.get_chart_and_text, outdated data is still
+    returned while it is regenerated in the background.
+    """
+    cache = organizer.cache
+    cache_key = get_campaign_cache_key(
+        campaign, get_campaign_version(campaign, events)
+    )
+    fresh_key = get_campaign_fresh_key(campaign)
+    cached = cache.get_many([cache_key, fresh_key])
+    chart_data = cached.get(cache_key)
+    if chart_data and cached.get(fresh_key):
+        return chart_data
+    if schedule_campaign_refresh(organizer, campaign):
+        # Without a celery worker, the task has been run eagerly
+        chart_data = cache.get(cache_key) or chart_data
+    return chart_data
+
+
+def schedule_campaign_refresh(organizer, campaign, force=False):
+    """Queue a background regeneration of the chart data of a campaign."""
+    from .tasks import refresh_campaign_chart_data
+
+    if not force and not caches["default"].add(
+        get_campaign_queued_key(organizer, campaign), True, timeout=LOCK_TIMEOUT
+    ):
+        return False
+    refresh_campaign_chart_data.apply_async(
+        args=(organizer.pk, campaign["id"]), kwargs={"force": force}
+    )
+    return True
+
+
+def refresh_campaign(organizer, campaign, force=False):
+    """
+    Regenerate and store the chart data of a campaign, unless it is still fresh
+    or has no events. Only one worker regenerates a campaign at a time.
+    """
+    cache = organizer.cache
+    events = get_campaign_events(organizer, campaign)
+    if not events:
+        return
+    cache_key = get_campaign_cache_key(
+        campaign, get_campaign_version(campaign, events)
+    )
+    fresh_key = get_campaign_fresh_key(campaign)
+    # The fresh marker is shared by all versions, as order changes have to
+    # outdate the data without knowing its version
+    if not force and len(cache.get_many([cache_key, fresh_key])) == 2:
+        return
+    lock_key = get_campaign_lock_key(organizer, campaign)
+    if not caches["default"].add(lock_key, True, timeout=LOCK_TIMEOUT):
+        return
+    try:
+        chart_data = compute_campaign(campaign, events)
+        cache.set(cache_key, chart_data, timeout=STALE_TIMEOUT)
+        cache.set(fresh_key, True, timeout=get_cache_timeout(events[-1]))
+    finally:
+        caches["default"].delete(lock_key)
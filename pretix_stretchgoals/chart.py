@@ -1,76 +1,131 @@
+import hashlib
 import json
 import pytz
-from datetime import date, datetime, timedelta
-from django.db.models import Avg, DateTimeField, Max, OuterRef, Subquery, Sum
-from django.db.models.query import QuerySet
+from asgiref.sync import sync_to_async
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import (
+    BigIntegerField, Case, Count, F, Max, Min, PositiveIntegerField, Q, Sum,
+    Value, When,
+)
+from django.db.models.functions import Cast, Round
 from django.utils.timezone import now
-from i18nfield.strings import LazyI18nString
-from pretix.base.i18n import language
 from pretix.base.models import Item, OrderPayment, OrderPosition
 
-from .json import ChartJSONEncoder
-from .utils import get_cache_key, get_goals
+from .config import get_config
+from .forecast import get_forecast
+from .models import DailyTotal, Snapshot
+from .payload import (
+    compress, decompress, divide, from_cents, get_label, iterate_series,
+    pack_series, pack_values, to_cents, to_float, unpack_values,
+)
+from .profiling import (
+    arecord_cache_result, get_profile, phase, record_cache_result,
+)
+from .svg import render_chart
+from .utils import (
+    get_cache_key, get_fresh_cache_key, get_lock_key, get_queued_key,
+)
 
+STALE_TIMEOUT = 7 * 24 * 3600  # stale data is still served while regenerating
+LOCK_TIMEOUT = 300
+RESOLUTIONS = ("hour", "day", "week", "auto")
+AUTO_HOURLY_DAYS = 3  # auto resolution uses hourly points for shorter ranges
+MAX_POINTS = 200  # auto resolution downsamples longer series to this many points
+COUNTED_PAYMENT_STATES = (
+    OrderPayment.PAYMENT_STATE_CONFIRMED,
+    OrderPayment.PAYMENT_STATE_REFUNDED,
+)
 
-def get_base_queryset(event, items, include_pending):
-    qs = OrderPosition.objects.filter(order__event=event)
-    allowed_states = ["p", "n"] if include_pending else ["p"]
-    op_date = (
+
+def get_payment_dates(event, start_dt=None, end_dt=None):
+    """
+    Return the effective payment date (the latest confirmed or refunded payment)
+    of every order, resolved once per order in a single grouped query.
+    """
+    qs = (
         OrderPayment.objects.filter(
-            order=OuterRef("order"),
-            state__in=(
-                OrderPayment.PAYMENT_STATE_CONFIRMED,
-                OrderPayment.PAYMENT_STATE_REFUNDED,
-            ),
+            order__event=event,
+            state__in=COUNTED_PAYMENT_STATES,
             payment_date__isnull=False,
         )
         .order_by()
         .values("order")
-        .annotate(m=Max("payment_date"))
-        .values("m")
+        .annotate(last_payment_date=Max("payment_date"))
     )
-    qs = qs.filter(order__status__in=allowed_states).annotate(
-        payment_date=Subquery(op_date, output_field=DateTimeField())
+    if start_dt:
+        qs = qs.filter(last_payment_date__gte=start_dt)
+    if end_dt:
+        qs = qs.filter(last_payment_date__lte=end_dt)
+    return qs
+
+
+def get_cents(field, places):
+    """Database expression for an amount in cents, see payload."""
+    return Cast(Round(F(field) * 10**places), BigIntegerField())
+
+
+def get_base_queryset(event, config):
+    allowed_states = ["p", "n"] if config.include_pending else ["p"]
+    qs = OrderPosition.objects.filter(
+        order__event=event, order__status__in=allowed_states
     )
-    if items:
-        qs = qs.filter(item__in=items)
-    if include_pending:
-        return qs.order_by("order__datetime")
-    return qs.order_by("payment_date")
+    if config.items:
+        qs = qs.filter(item__in=config.items)
+    return qs.order_by()
 
 
-def get_start_date(event, items, include_pending):
-    tz = pytz.timezone(event.settings.timezone)
-    start_date = event.settings.get("stretchgoals_start_date", as_type=date)
-    if start_date:
-        return start_date
-    first_order = get_base_queryset(event, items, include_pending).first()
-    if first_order:
-        if include_pending:
-            return first_order.order.datetime.astimezone(tz).date()
-        if first_order.order and first_order.payment_date:
-            return first_order.payment_date.astimezone(tz).date()
+def get_sale_stats(event, config):
+    """
+    Return the first and last sale, and the number, sum and average price (in
+    cents) of all counted positions. Pending orders are covered by a single
+    aggregate query; for paid orders, the payment dates are aggregated
+    separately.
+    """
+    qs = get_base_queryset(event, config)
+    total = Sum(get_cents("price", config.places))
+    if config.include_pending:
+        stats = qs.aggregate(
+            first=Min("order__datetime"),
+            last=Max("order__datetime"),
+            count=Count("id"),
+            total=total,
+        )
+    else:
+        stats = qs.aggregate(count=Count("id"), total=total)
+        stats.update(
+            get_payment_dates(event)
+            .filter(order__in=qs.values("order"))
+            .aggregate(first=Min("last_payment_date"), last=Max("last_payment_date"))
+        )
+    stats["total"] = stats["total"] or 0
+    stats["average"] = divide(stats["total"], stats["count"]) if stats["count"] else 0
+    return stats
+
+
+def get_start_date(config, stats):
+    tz = config.timezone
+    if config.start_date:
+        return config.start_date
+    if stats["first"]:
+        return stats["first"].astimezone(tz).date()
     return (now() - timedelta(days=2)).astimezone(tz).date()
 
 
-def get_end_date(event, items, include_pending):
-    tz = pytz.timezone(event.settings.timezone)
-    end_date = event.settings.get("stretchgoals_end_date", as_type=date)
-    if end_date:
-        return end_date
-    last_order = get_base_queryset(event, items, include_pending).last()
-    if last_order:
-        if include_pending:
-            last_date = last_order.order.datetime.astimezone(tz).date()
-        else:
-            last_date = last_order.payment_date.astimezone(tz).date()
-        if (
-            last_date == now().astimezone(tz).date()
-            and event.settings.stretchgoals_is_public
-        ):
+def get_end_date(config, stats, public=False):
+    """The public chart leaves out the current day, as it is not over yet."""
+    tz = config.timezone
+    if config.end_date:
+        return config.end_date
+    if stats["last"]:
+        last_date = stats["last"].astimezone(tz).date()
+        if last_date == now().astimezone(tz).date() and public:
             return last_date - timedelta(days=1)
         return last_date
-    if event.settings.stretchgoals_is_public:
+    if public:
         return (now() - timedelta(days=1)).astimezone(tz).date()
     return now().astimezone(tz).date()
 
@@ -80,67 +135,469 @@ def get_date_range(start_date, end_date):
         yield start_date + timedelta(days=offset)
 
 
-def get_average_price(event, start_date, end_date, items, include_pending):
-    tz = pytz.timezone(event.settings.timezone)
-    start_dt = datetime(
-        start_date.year, start_date.month, start_date.day, 0, 0, 0, tzinfo=tz
-    )
-    end_dt = datetime(
-        end_date.year, end_date.month, end_date.day, 23, 59, 59, tzinfo=tz
-    )
-    if include_pending:
-        qs = get_base_queryset(event, items, include_pending).filter(
+def get_day_start(day, tz):
+    return datetime(day.year, day.month, day.day, 0, 0, 0, tzinfo=tz)
+
+
+def get_day_end(day, tz):
+    return datetime(day.year, day.month, day.day, 23, 59, 59, tzinfo=tz)
+
+
+def get_day(timestamp, tz):
+    """Return the day whose get_day_start/get_day_end window contains timestamp."""
+    day = timestamp.astimezone(tz).date()
+    if timestamp > get_day_end(day, tz):
+        return day + timedelta(days=1)
+    if timestamp < get_day_start(day, tz):
+        return day - timedelta(days=1)
+    return day
+
+
+def get_range_queryset(event, config, start_date, end_date):
+    start_dt = get_day_start(start_date, config.timezone)
+    end_dt = get_day_end(end_date, config.timezone)
+    if config.include_pending:
+        return get_base_queryset(event, config).filter(
             order__datetime__gte=start_dt, order__datetime__lte=end_dt
         )
-    else:
-        qs = get_base_queryset(event, items, include_pending).filter(
-            payment_date__gte=start_dt, payment_date__lte=end_dt
-        )
-    return round(qs.aggregate(Avg("price")).get("price__avg") or 0, 2)
+    return get_base_queryset(event, config).filter(
+        order__in=get_payment_dates(event, start_dt, end_dt).values("order")
+    )
 
 
-def get_total_price(event, start_date, end_date, items, include_pending):
-    tz = pytz.timezone(event.settings.timezone)
-    start_dt = datetime(
-        start_date.year, start_date.month, start_date.day, 0, 0, 0, tzinfo=tz
+def iterate_sales(event, config, start_date, end_date, fields=()):
+    """
+    Yield (timestamp, cents, *fields) for every position counted in the range,
+    with the order date or the effective payment date as timestamp.
+    """
+    qs = get_range_queryset(event, config, start_date, end_date).annotate(
+        cents=get_cents("price", config.places)
     )
-    end_dt = datetime(
-        end_date.year, end_date.month, end_date.day, 23, 59, 59, tzinfo=tz
+    if config.include_pending:
+        yield from qs.values_list("order__datetime", "cents", *fields).iterator()
+        return
+    tz = config.timezone
+    payment_dates = dict(
+        get_payment_dates(
+            event, get_day_start(start_date, tz), get_day_end(end_date, tz)
+        ).values_list("order", "last_payment_date")
     )
-    if include_pending:
-        qs = get_base_queryset(event, items, include_pending).filter(
-            order__datetime__gte=start_dt, order__datetime__lte=end_dt
+    for order_id, *row in qs.values_list("order_id", "cents", *fields).iterator():
+        timestamp = payment_dates.get(order_id)
+        if timestamp is None:  # paid after the payment dates were fetched
+            continue
+        yield (timestamp, *row)
+
+
+def get_bucket_totals(event, config, start_date, end_date, buckets, bucket_ends):
+    """
+    Count and sum up positions (in cents) per bucket in a single pass over the
+    range. The buckets have to cover the range, bucket_ends holds the last
+    second of each.
+    """
+    counts = [0] * len(buckets)
+    totals = [0] * len(buckets)
+    for timestamp, cents in iterate_sales(event, config, start_date, end_date):
+        index = bisect_left(bucket_ends, timestamp)
+        counts[index] += 1
+        totals[index] += cents
+    return list(zip(buckets, counts, totals))
+
+
+def get_daily_totals(event, config, start_date, end_date):
+    """Count and sum up positions per day in a single pass over the range."""
+    days = list(get_date_range(start_date, end_date))
+    if not days:
+        return []
+    return get_bucket_totals(
+        event,
+        config,
+        start_date,
+        end_date,
+        days,
+        [get_day_end(day, config.timezone) for day in days],
+    )
+
+
+def get_hour(timestamp, tz):
+    """Return the start of the local hour of a timestamp, as a naive datetime."""
+    return timestamp.astimezone(tz).replace(
+        minute=0, second=0, microsecond=0, tzinfo=None
+    )
+
+
+def get_hours(start_date, end_date):
+    """Return the starts of all local hours of the range, see get_hour."""
+    return [
+        datetime(day.year, day.month, day.day, hour)
+        for day in get_date_range(start_date, end_date)
+        for hour in range(24)
+    ]
+
+
+def get_hourly_totals(event, config, start_date, end_date):
+    """
+    Like get_daily_totals, with one bucket per hour of local time, keyed by its
+    start, see get_hour. Sales are bucketed by their local hour, so the range is
+    fetched with a day of margin and sales outside it are left out.
+    """
+    hours = get_hours(start_date, end_date)
+    if not hours:
+        return []
+    indices = {hour: index for index, hour in enumerate(hours)}
+    counts = [0] * len(hours)
+    totals = [0] * len(hours)
+    for timestamp, cents in iterate_sales(
+        event, config, start_date - timedelta(days=1), end_date + timedelta(days=1)
+    ):
+        index = indices.get(get_hour(timestamp, config.timezone))
+        if index is None:
+            continue
+        counts[index] += 1
+        totals[index] += cents
+    return list(zip(hours, counts, totals))
+
+
+def get_weekly_totals(daily_totals):
+    """
+    Sum up daily (date, count, total) buckets per week. Each week is keyed by
+    its last day within the range, as the chart shows the state at its end.
+    """
+    weeks = []
+    for day, count, total in daily_totals:
+        if weeks and weeks[-1][0].isocalendar()[:2] == day.isocalendar()[:2]:
+            weeks[-1] = (day, weeks[-1][1] + count, weeks[-1][2] + total)
+        else:
+            weeks.append((day, count, total))
+    return weeks
+
+
+def get_resolution(config, start_date, end_date):
+    """Return the configured resolution, with auto resolved for the given range."""
+    resolution = config.resolution
+    if resolution not in RESOLUTIONS:
+        return "day"
+    if resolution == "auto":
+        if (end_date - start_date).days < AUTO_HOURLY_DAYS:
+            return "hour"
+        return "day"
+    return resolution
+
+
+def get_series_totals(event, config, resolution, daily_totals, hourly_totals=None):
+    """
+    Return the (bucket, count, total) buckets of the chart in the given
+    resolution. Hourly buckets are read from the positions, unless they are
+    given already.
+    """
+    if not daily_totals or resolution == "day":
+        return daily_totals
+    if resolution == "week":
+        return get_weekly_totals(daily_totals)
+    if hourly_totals is not None:
+        return hourly_totals
+    return get_hourly_totals(event, config, daily_totals[0][0], daily_totals[-1][0])
+
+
+def downsample(values, threshold):
+    """
+    Reduce a series of chart values to at most threshold points with the
+    largest-triangle-three-buckets algorithm, which keeps the visual shape of
+    the series including its first and last point. Returns the indices of the
+    points to keep.
+    """
+    if threshold < 3 or len(values) <= threshold:
+        return list(range(len(values)))
+    values = [float(value) for value in values]
+    sampled = [0]
+    bucket_size = (len(values) - 2) / (threshold - 2)
+    previous = 0
+    for index in range(threshold - 2):
+        start = int(index * bucket_size) + 1
+        end = int((index + 1) * bucket_size) + 1
+        next_end = min(int((index + 2) * bucket_size) + 1, len(values))
+        if next_end <= end:
+            next_end = len(values)
+        next_x = (end + next_end - 1) / 2
+        next_y = sum(values[end:next_end]) / (next_end - end)
+        previous_y = values[previous]
+        best, best_area = start, -1
+        for candidate in range(start, end):
+            area = abs(
+                (previous - next_x) * (values[candidate] - previous_y)
+                - (previous - candidate) * (next_y - previous_y)
+            )
+            if area > best_area:
+                best, best_area = candidate, area
+        sampled.append(best)
+        previous = best
+    sampled.append(len(values) - 1)
+    return sampled
+
+
+def get_breakdown_totals(event, config, start_date, end_date):
+    """
+    Like get_daily_totals, but also count and sum up the positions per day for
+    every item and every subevent, in the same single pass over the range.
+    Returns the daily totals and a breakdown dict mapping "items" and
+    "subevents" to {pk: (counts per day, totals per day)}.
+    """
+    days = list(get_date_range(start_date, end_date))
+    breakdown = {"items": {}, "subevents": {}}
+    if not days:
+        return [], breakdown
+    day_ends = [get_day_end(day, config.timezone) for day in days]
+    counts = [0] * len(days)
+    totals = [0] * len(days)
+    for timestamp, cents, item_id, subevent_id in iterate_sales(
+        event, config, start_date, end_date, fields=("item_id", "subevent_id")
+    ):
+        index = bisect_left(day_ends, timestamp)
+        counts[index] += 1
+        totals[index] += cents
+        for kind, pk in (("items", item_id), ("subevents", subevent_id)):
+            if pk is None:
+                continue
+            if pk not in breakdown[kind]:
+                breakdown[kind][pk] = ([0] * len(days), [0] * len(days))
+            breakdown[kind][pk][0][index] += 1
+            breakdown[kind][pk][1][index] += cents
+    return list(zip(days, counts, totals)), breakdown
+
+
+def get_filter_key(config):
+    """
+    Key of the stored daily totals: they depend on the counted orders and items,
+    on the timezone the days are bucketed in and on the places of the cents.
+    """
+    return "{}:{}:{}:{}".format(
+        "pending" if config.include_pending else "paid",
+        ",".join(str(pk) for pk in config.items) or "all",
+        config.timezone,
+        config.places,
+    )
+
+
+def get_date_runs(days):
+    """Group a sorted list of dates into (first, last) runs of consecutive days."""
+    runs = []
+    for day in days:
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def get_generations(configs):
+    """
+    Return {event id: {date: generation}} of the stored daily totals of the given
+    {event id: ChartConfig} dict, in a single query. They have to be read before
+    the positions, so that store_daily_totals can tell which days have been
+    marked as dirty since.
+    """
+    result = {pk: {} for pk in configs}
+    if not configs:
+        return result
+    condition = Q()
+    for pk, config in configs.items():
+        condition |= Q(event_id=pk, filter_key=get_filter_key(config))
+    for event_id, day, generation in DailyTotal.objects.filter(condition).values_list(
+        "event_id", "date", "generation"
+    ):
+        result[event_id][day] = generation
+    return result
+
+
+def get_stored_daily_totals(
+    event, config, start_date, end_date, store=True, rebuild=False
+):
+    """
+    Like get_daily_totals, but finished days are read from (and, unless store is
+    False, written to) the DailyTotal table, so that only days that are still
+    running or have been marked as dirty are computed from the positions again.
+    With rebuild, all days are computed again.
+    """
+    tz = config.timezone
+    filter_key = get_filter_key(config)
+    current = now()
+    stored = {
+        row.date: row
+        for row in DailyTotal.objects.filter(
+            event=event, filter_key=filter_key, date__gte=start_date, date__lte=end_date
         )
-    else:
-        qs = get_base_queryset(event, items, include_pending).filter(
-            payment_date__gte=start_dt, payment_date__lte=end_dt
+    }
+    outdated = [
+        day
+        for day in get_date_range(start_date, end_date)
+        if rebuild
+        or day not in stored
+        or stored[day].dirty
+        or get_day_end(day, tz) >= current
+    ]
+    computed = {}
+    for run_start, run_end in get_date_runs(outdated):
+        for day, count, total in get_daily_totals(event, config, run_start, run_end):
+            computed[day] = (count, total)
+
+    if store:
+        store_daily_totals(
+            event,
+            config,
+            [(day, count, total) for day, (count, total) in computed.items()],
+            {day: row.generation for day, row in stored.items()},
         )
-    return round(qs.aggregate(Sum("price")).get("price__sum") or 0, 2)
+    result = []
+    for day in get_date_range(start_date, end_date):
+        if day in computed:
+            count, total = computed[day]
+        else:
+            count, total = stored[day].count, stored[day].total
+        result.append((day, count, total))
+    return result
 
 
-def get_required_average_price(
-    event, items, include_pending, target, total_count, total_now
-):
-    if not target:
+def store_daily_totals(event, config, daily_totals, generations):
+    """
+    Write the finished days of the given (date, count, total) buckets to the
+    DailyTotal table. generations holds the {date: generation} of the stored
+    days as they were before the positions were read, see get_generations: a
+    stored day is only overwritten if it has not been marked as dirty since,
+    and a new day is not written if it has been created by mark_days_dirty.
+    """
+    tz = config.timezone
+    filter_key = get_filter_key(config)
+    current = now()
+    finished = [
+        (day, count, total)
+        for day, count, total in daily_totals
+        if get_day_end(day, tz) < current
+    ]
+    if not finished:
         return
-    start_date = get_start_date(event, items, include_pending)
-    end_date = get_end_date(event, items, include_pending)
-    tz = pytz.timezone(event.settings.timezone)
-    start_dt = datetime(
-        start_date.year, start_date.month, start_date.day, 0, 0, 0, tzinfo=tz
+    by_generation = defaultdict(list)
+    for day, count, total in finished:
+        if day in generations:
+            by_generation[generations[day]].append((day, count, total))
+    with transaction.atomic():
+        for generation, rows in by_generation.items():
+            DailyTotal.objects.filter(
+                event=event,
+                filter_key=filter_key,
+                generation=generation,
+                date__in=[day for day, _, _ in rows],
+            ).update(
+                count=Case(
+                    *[When(date=day, then=Value(count)) for day, count, _ in rows],
+                    output_field=PositiveIntegerField(),
+                ),
+                total=Case(
+                    *[When(date=day, then=Value(total)) for day, _, total in rows],
+                    output_field=BigIntegerField(),
+                ),
+                dirty=False,
+            )
+        DailyTotal.objects.bulk_create(
+            [
+                DailyTotal(
+                    event=event, filter_key=filter_key, date=day, count=count, total=total
+                )
+                for day, count, total in finished
+                if day not in generations
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def store_snapshot(event, config, stats, daily_totals):
+    """
+    Append the daily totals of a regeneration to the snapshot history, unless
+    they are the same as in the latest snapshot. Costs a lookup of the latest
+    digest and, if anything changed, a single insert.
+    """
+    filter_key = get_filter_key(config)
+    counts = pack_values([count for day, count, total in daily_totals])
+    totals = pack_values([total for day, count, total in daily_totals])
+    start = daily_totals[0][0] if daily_totals else None
+    digest = hashlib.sha1(
+        b"|".join(
+            [
+                filter_key.encode(),
+                start.isoformat().encode() if start else b"",
+                str(stats["count"]).encode(),
+                counts,
+                totals,
+            ]
+        )
+    ).hexdigest()
+    latest = (
+        Snapshot.objects.filter(event=event)
+        .order_by("-created", "-pk")
+        .values_list("digest", flat=True)
+        .first()
     )
-    end_dt = datetime(
-        end_date.year, end_date.month, end_date.day, 23, 59, 59, tzinfo=tz
+    if latest == digest:
+        return None
+    return Snapshot.objects.create(
+        event=event,
+        filter_key=filter_key,
+        start=start,
+        count=stats["count"],
+        total=stats["total"],
+        counts=counts,
+        totals=totals,
+        digest=digest,
     )
-    if include_pending:
-        all_orders = get_base_queryset(event, items, include_pending).filter(
-            order__datetime__gte=start_dt, order__datetime__lte=end_dt
-        )
-    else:
-        all_orders = get_base_queryset(event, items, include_pending).filter(
-            payment_date__gte=start_dt, payment_date__lte=end_dt
+
+
+def mark_days_dirty(event, days, filter_key=None):
+    """
+    Make sure the given days are recomputed the next time the chart is built.
+    With a filter key, dirty rows are added for days that are not stored yet,
+    so that a computation that is still running does not store them as clean.
+    """
+    DailyTotal.objects.filter(event=event, date__in=days).update(
+        dirty=True, generation=F("generation") + 1
+    )
+    if filter_key:
+        DailyTotal.objects.bulk_create(
+            [
+                DailyTotal(event=event, filter_key=filter_key, date=day, dirty=True)
+                for day in days
+            ],
+            ignore_conflicts=True,
         )
-    current_count = all_orders.count()
+
+
+def mark_order_dirty(order):
+    """Mark all days an order may have been counted on as dirty."""
+    config = get_config(order.event)
+    timestamps = [order.datetime] + list(
+        order.payments.filter(
+            state__in=COUNTED_PAYMENT_STATES,
+            payment_date__isnull=False,
+        ).values_list("payment_date", flat=True)
+    )
+    mark_days_dirty(
+        order.event,
+        {get_day(timestamp, config.timezone) for timestamp in timestamps},
+        filter_key=get_filter_key(config),
+    )
+
+
+def get_cumulative_prices(daily_totals):
+    """Turn daily (date, count, total) buckets into running averages and totals, in cents."""
+    count = 0
+    total = 0
+    for day, day_count, day_total in daily_totals:
+        count += day_count
+        total += day_total
+        yield day, divide(total, count) if count else 0, total
+
+
+def get_required_average_price(target, total_count, total_now, current_count):
+    if not target:
+        return
 
     if total_now > target:
         return 0
@@ -151,128 +608,440 @@ def get_required_average_price(
         return None
 
 
-def get_public_text(event, items, include_pending, data=None):
-    text = event.settings.get("stretchgoals_public_text", as_type=LazyI18nString)
-    if not text:
+def get_public_text(config, avg_now):
+    """Return the public text in the active locale, with the average filled in."""
+    if not config.public_text:
         return ""
+    return str(config.public_text).format(avg_now=avg_now)
+
+
+def get_breakdown_labels(event, kind, pks):
+    """Return the names of the given items or subevents in the active locale."""
+    if kind == "items":
+        objects = Item.objects.filter(event=event, pk__in=pks)
+    else:
+        objects = event.subevents.filter(pk__in=pks)
+    return {obj.pk: str(obj) for obj in objects}
+
+
+def pack_breakdown(days, breakdown):
+    """
+    Turn the per-day breakdown of get_breakdown_totals into packed cumulative
+    revenue series, one chart per kind, with the largest series first.
+    """
     result = {}
-    for locale in event.settings.locales:
-        with language(locale):
-            locale_text = str(text)
-            if data:
-                locale_text = locale_text.format(**{"avg_now": data["avg_now"]})
-            result[locale] = locale_text
+    if not days:
+        return result
+    for kind, series in breakdown.items():
+        if not series:
+            continue
+        keys = sorted(series, key=lambda pk: sum(series[pk][1]), reverse=True)
+        values = []
+        for pk in keys:
+            cumulative = 0
+            totals = []
+            for total in series[pk][1]:
+                cumulative += total
+                totals.append(cumulative)
+            values.append(pack_series(days[0], days, totals))
+        result[kind] = {"keys": keys, "values": values}
     return result
 
 
-def get_chart_and_text(event):
-    cache = event.cache
-    cache_key = get_cache_key(event)
-    chart_data = cache.get(cache_key)
-    if chart_data:
-        return chart_data
+def render_breakdown(event, start, breakdown, places=2):
+    result = {}
+    for kind, series in breakdown.items():
+        labels = get_breakdown_labels(event, kind, series["keys"])
+        rows = []
+        for pk, values in zip(series["keys"], series["values"]):
+            for index, (label, total) in enumerate(
+                iterate_series(start, values, places=places)
+            ):
+                if index == len(rows):
+                    rows.append({"date": label})
+                rows[index][str(pk)] = total
+        result[kind] = {
+            "keys": [str(pk) for pk in series["keys"]],
+            "labels": [labels.get(pk) or str(pk) for pk in series["keys"]],
+            "data": json.dumps(rows),
+        }
+    return result
+
+
+def get_cache_timeout(event):
+    """
+    Order changes invalidate the cache via signals, so the cached data only has
+    to expire when the current day is over and the charted range moves on.
+    """
+    tz = pytz.timezone(event.settings.timezone)
+    current = now()
+    day_end = get_day_end(get_day(current, tz), tz)
+    return max(int((day_end - current).total_seconds()) + 1, 60)
+
+
+def compute_chart_and_text(
+    event, public=False, profile=None, store=True, rebuild=False
+):
+    """
+    Compute the chart data of an event from the positions. Unless store is
+    False, the finished days are written to the rollup table and the daily
+    totals of the backend chart to the snapshot history. With rebuild, the
+    stored days are computed again as well.
+    """
+    with phase(profile, "settings"):
+        config = get_config(event)
 
-    include_pending = event.settings.stretchgoals_include_pending or False
-    avg_chart = event.settings.stretchgoals_chart_averages or False
-    total_chart = event.settings.stretchgoals_chart_totals or False
-    event.settings._h.add_type(
-        QuerySet,
-        lambda queryset: ",".join([str(element.pk) for element in queryset]),
-        lambda pk_list: (
-            Item.objects.filter(pk__in=pk_list.split(",")) if pk_list else []
-        ),
+    with phase(profile, "stats"):
+        stats = get_sale_stats(event, config)
+        start_date = get_start_date(config, stats)
+        end_date = get_end_date(config, stats, public=public)
+    with phase(profile, "daily totals"):
+        if config.breakdown and not public:
+            # The breakdown needs every position, so the rollup table cannot
+            # save anything – the whole range is covered in one pass instead.
+            generations = get_generations({event.pk: config})[event.pk]
+            daily_totals, breakdown = get_breakdown_totals(
+                event, config, start_date, end_date
+            )
+            if store:
+                store_daily_totals(event, config, daily_totals, generations)
+        else:
+            daily_totals = get_stored_daily_totals(
+                event, config, start_date, end_date, store=store, rebuild=rebuild
+            )
+            breakdown = None
+    if store and not public:
+        with phase(profile, "snapshot"):
+            store_snapshot(event, config, stats, daily_totals)
+    return build_chart_and_text(
+        event, config, stats, daily_totals, breakdown=breakdown, profile=profile
     )
-    items = event.settings.get("stretchgoals_items", as_type=QuerySet) or []
-
-    start_date = get_start_date(event, items, include_pending)
-    end_date = get_end_date(event, items, include_pending)
-    goals = get_goals(event)
-    data = {
-        "avg_data": {
-            "data": (
-                [
-                    {
-                        "date": date.strftime("%Y-%m-%d"),
-                        "price": get_average_price(
-                            event, start_date, date, items, include_pending
-                        )
-                        or 0,
-                    }
-                    for date in get_date_range(start_date, end_date)
-                ]
-                if avg_chart
+
+
+def build_chart_and_text(
+    event,
+    config,
+    stats,
+    daily_totals,
+    breakdown=None,
+    profile=None,
+    hourly_totals=None,
+):
+    """
+    Turn the sale stats and daily totals of an event into the compact chart data
+    that is cached, see render_chart_data. With an hourly resolution, the hourly
+    totals are read from the positions unless they are given.
+    """
+    with phase(profile, "series"):
+        days = [day for day, count, total in daily_totals]
+        resolution = get_resolution(config, days[0], days[-1]) if days else "day"
+        prices = list(
+            get_cumulative_prices(
+                get_series_totals(
+                    event, config, resolution, daily_totals, hourly_totals
+                )
+            )
+        )
+        buckets = [bucket for bucket, average, total in prices]
+        series = {
+            "avg": (
+                [average for bucket, average, total in prices]
+                if config.chart_averages
                 else None
             ),
-            "target": [goal.get("avg", 0) for goal in goals],
-            "label": "avg",
-        },
-        "total_data": {
-            "data": (
-                [
-                    {
-                        "date": date.strftime("%Y-%m-%d"),
-                        "price": get_total_price(
-                            event, start_date, date, items, include_pending
-                        )
-                        or 0,
-                    }
-                    for date in get_date_range(start_date, end_date)
-                ]
-                if total_chart
+            "total": (
+                [total for bucket, average, total in prices]
+                if config.chart_totals
                 else None
             ),
-            "target": [goal["total"] for goal in goals],
-            "label": "total",
+        }
+        result = {
+            "start": days[0] if days else None,
+            "hourly": resolution == "hour",
+            "places": config.places,
+            "count": sum(count for day, count, total in daily_totals),
+            "revenue": prices[-1][2] if prices else 0,
+        }
+        points = {}
+        for key, values in series.items():
+            result["{}_now".format(key)] = values[-1] if values else 0
+            if values is None:
+                result[key] = None
+                continue
+            if config.resolution == "auto":
+                indices = downsample(values, MAX_POINTS)
+            else:
+                indices = range(len(values))
+            points[key] = [(buckets[index], values[index]) for index in indices]
+            result[key] = pack_series(result["start"], *zip(*points[key]))
+            result[key]["ymin"] = min(
+                [value for value in values if value] or [0]
+            ) // 10**config.places
+
+    forecast = result["forecast"] = result["goal_dates"] = None
+    if config.forecast:
+        with phase(profile, "forecast"):
+            forecast = get_forecast(
+                daily_totals,
+                [to_cents(goal["total"] or 0, config.places) for goal in config.goals],
+                event_date=event.date_from.astimezone(config.timezone).date(),
+            )
+            if forecast:
+                result["forecast"] = pack_forecast(days[-1], forecast)
+                result["goal_dates"] = forecast["goal_dates"]
+
+    result["svg"] = None
+    if config.static_charts:
+        with phase(profile, "svg"):
+            targets = {
+                "avg": [goal.get("avg", 0) for goal in config.goals],
+                "total": [goal["total"] for goal in config.goals],
+            }
+            forecast_rows = [
+                (
+                    days[-1] + timedelta(days=index),
+                    to_float(row["forecast"], config.places),
+                    to_float(row["lower"], config.places),
+                    to_float(row["upper"], config.places),
+                )
+                for index, row in enumerate(forecast["data"] if forecast else ())
+            ]
+            result["svg"] = {
+                key: compress(
+                    render_chart(
+                        [
+                            (bucket, to_float(value, config.places))
+                            for bucket, value in points[key]
+                        ],
+                        targets[key],
+                        forecast_rows if key == "total" else (),
+                    ).encode()
+                )
+                if points.get(key)
+                else None
+                for key in ("avg", "total")
+            }
+
+    result["significant"] = (
+        not config.min_orders or stats["count"] >= config.min_orders
+    )
+    result["breakdown"] = None
+    if breakdown is not None:
+        with phase(profile, "breakdown"):
+            result["breakdown"] = pack_breakdown(days, breakdown)
+    result["last_generated"] = now()
+    return result
+
+
+def pack_forecast(start, forecast):
+    """Pack the daily forecast series, which starts on the last day of the chart."""
+    return {
+        "model": forecast["model"],
+        "start": start,
+        "series": {
+            key: pack_values([row[key] for row in forecast["data"]])
+            for key in ("forecast", "lower", "upper")
         },
+        "projected_total": forecast["projected_total"],
+        "projected_lower": forecast["projected_lower"],
+        "projected_upper": forecast["projected_upper"],
+        "projected_date": forecast["projected_date"],
     }
-    if avg_chart:
-        data["avg_data"]["ymin"] = int(
-            min([d["price"] for d in data["avg_data"]["data"] if d["price"]] or [0])
-        )
-    if total_chart:
-        data["total_data"]["ymin"] = int(
-            min([d["price"] for d in data["total_data"]["data"] if d["price"]] or [0])
-        )
-    try:
-        avg_now = data["avg_data"]["data"][-1]["price"]
-    except (TypeError, IndexError):  # no data, data[-1] does not exist
-        avg_now = 0
 
-    try:
-        total_now = data["total_data"]["data"][-1]["price"]
-    except (TypeError, IndexError):  # no data, data[-1] does not exist
-        total_now = 0
 
-    result = {
-        "avg_now": avg_now,
-        "total_now": total_now,
-        "data": {
-            key: json.dumps(value, cls=ChartJSONEncoder) for key, value in data.items()
-        },
+def render_forecast_series(forecast, places=2):
+    series = {
+        key: unpack_values(values) for key, values in forecast["series"].items()
     }
+    return [
+        {
+            "date": get_label(forecast["start"], offset),
+            "forecast": to_float(series["forecast"][offset], places),
+            "lower": to_float(series["lower"][offset], places),
+            "upper": to_float(series["upper"][offset], places),
+        }
+        for offset in range(len(series["forecast"]))
+    ]
 
-    for goal in goals:
+
+def render_series(data, key, target):
+    """
+    Render a chart series for Morris. It only contains floats, strings and
+    ints, so that the C encoder of the json module never calls back into
+    Python for a value.
+    """
+    packed = data[key]
+    result = {"data": None, "target": target, "label": key}
+    if packed is None:
+        return result
+    result["data"] = [
+        {"date": label, "price": price}
+        for label, price in iterate_series(
+            data["start"], packed, data["hourly"], data["places"]
+        )
+    ]
+    result["ymin"] = packed["ymin"]
+    if key == "total" and data["forecast"]:
+        result["forecast"] = render_forecast_series(data["forecast"], data["places"])
+    return result
+
+
+def render_chart_data(event, data, series=True, config=None, breakdown=False):
+    """
+    Render cached chart data for a response: amounts as Decimals, the goals with
+    their names and progress, the public text in the active locale and, unless
+    series is False, the chart series as serialised JSON. The breakdown, which
+    needs further queries for its labels, is only rendered if asked for. The
+    goals are taken from the given config, or from the settings of the event.
+    """
+    config = config or get_config(event)
+    goals = [dict(goal) for goal in config.goals]
+    places = data["places"]
+    avg_now = from_cents(data["avg_now"], places) or 0
+    total_now = from_cents(data["total_now"], places) or 0
+    # Unlike total_now, the revenue is known without the total revenue chart
+    revenue = from_cents(data["revenue"], places)
+    for index, goal in enumerate(goals):
         goal["avg_required"] = get_required_average_price(
-            event=event,
-            items=items,
-            include_pending=include_pending,
             target=goal["total"],
             total_count=goal["amount"],
-            total_now=result["total_now"] or get_total_price(
-                event, start_date, end_date, items, include_pending
-            ),
+            total_now=revenue,
+            current_count=data["count"],
         )
-        goal["total_left"] = goal["total"] - result["total_now"]
+        goal["total_left"] = goal["total"] - revenue
+        goal["projected_date"] = (
+            data["goal_dates"][index] if data["goal_dates"] else None
+        )
+    forecast = data["forecast"]
+    result = {
+        "avg_now": avg_now,
+        "total_now": total_now,
+        "revenue": revenue,
+        "goals": goals,
+        "significant": data["significant"],
+        "public_text": get_public_text(config, avg_now),
+        "forecast": {
+            "model": forecast["model"],
+            "projected_total": from_cents(forecast["projected_total"], places),
+            "projected_lower": from_cents(forecast["projected_lower"], places),
+            "projected_upper": from_cents(forecast["projected_upper"], places),
+            "projected_date": forecast["projected_date"],
+        }
+        if forecast
+        else None,
+        "last_generated": data["last_generated"],
+    }
+    if series:
+        result["data"] = {
+            "avg_data": json.dumps(
+                render_series(data, "avg", [goal.get("avg", 0) for goal in goals]),
+            ),
+            "total_data": json.dumps(
+                render_series(data, "total", [goal["total"] for goal in goals]),
+            ),
+        }
+        if data["svg"]:
+            result["svg"] = {
+                key: decompress(svg).decode() if svg else None
+                for key, svg in data["svg"].items()
+            }
+        if breakdown and data["breakdown"] is not None:
+            result["breakdown"] = render_breakdown(
+                event, data["start"], data["breakdown"], places
+            )
+    return result
 
-    result["goals"] = goals
-    result["significant"] = (
-        not event.settings.stretchgoals_min_orders
-        or get_base_queryset(event, items, include_pending).count()
-        >= event.settings.get("stretchgoals_min_orders", as_type=int)
+
+def get_cache_keys(event, public=False):
+    """Return the keys of the chart data and of its freshness marker."""
+    return get_cache_key(event, public), get_fresh_cache_key(event, public)
+
+
+def get_chart_and_text(event, public=False, profile=None):
+    """
+    Return the stored chart data, or None if it has not been generated yet.
+
+    Outdated data is still returned, but a background regeneration is
+    scheduled, so that web requests never have to compute it themselves.
+    """
+    cache = event.cache
+    cache_key, fresh_key = get_cache_keys(event, public)
+    cached = cache.get_many([cache_key, fresh_key])
+    chart_data = cached.get(cache_key)
+    if chart_data and cached.get(fresh_key):
+        record_cache_result(profile, "hit")
+        return chart_data
+    record_cache_result(profile, "stale" if chart_data else "miss")
+    if schedule_refresh(event, public=public):
+        # Without a celery worker, the task has been run eagerly
+        chart_data = cache.get(cache_key) or chart_data
+    return chart_data
+
+
+async def aget_chart_and_text(event, cache_keys, public=False):
+    """
+    Async counterpart of get_chart_and_text. The cache keys depend on settings
+    and have to be computed with get_cache_keys beforehand, in a thread. The
+    cache of the event has no async API, so it is read in a thread as well.
+    """
+    cache = event.cache
+    cache_key, fresh_key = cache_keys
+    get_many = sync_to_async(cache.get_many, thread_sensitive=False)
+    cached = await get_many([cache_key, fresh_key])
+    chart_data = cached.get(cache_key)
+    if chart_data and cached.get(fresh_key):
+        await arecord_cache_result("hit")
+        return chart_data
+    await arecord_cache_result("stale" if chart_data else "miss")
+    if await sync_to_async(schedule_refresh)(event, public=public):
+        chart_data = (await get_many([cache_key])).get(cache_key) or chart_data
+    return chart_data
+
+
+def schedule_refresh(event, public=False, force=False):
+    """
+    Queue a background regeneration of the chart data. Unless forced, nothing
+    is queued if a regeneration is queued already. Returns whether a task was
+    queued.
+    """
+    from .tasks import refresh_chart_data
+
+    if not force and not caches["default"].add(
+        get_queued_key(event, public), True, timeout=LOCK_TIMEOUT
+    ):
+        return False
+    refresh_chart_data.apply_async(
+        args=(event.pk,), kwargs={"public": public, "force": force}
     )
-    result["public_text"] = get_public_text(event, items, include_pending, data=result)
-    result["last_generated"] = now()
-    cache.set(
-        cache_key, result, timeout=3600
-    )  # timeout is set in seconds, so it's hourly
-    return result
+    return True
+
+
+def store_chart_and_text(event, chart_data, public=False):
+    event.cache.set(get_cache_key(event, public), chart_data, timeout=STALE_TIMEOUT)
+    event.cache.set(
+        get_fresh_cache_key(event, public), True, timeout=get_cache_timeout(event)
+    )
+
+
+def refresh_chart_and_text(event, public=False, force=False):
+    """
+    Regenerate and store the chart data, unless it is still fresh. Only one
+    worker regenerates the data of an event at a time.
+    """
+    cache = event.cache
+    if not force and cache.get(get_fresh_cache_key(event, public)):
+        return
+    lock_key = get_lock_key(event, public)
+    if not caches["default"].add(lock_key, True, timeout=LOCK_TIMEOUT):
+        return
+    try:
+        profile = get_profile()
+        # A forced regeneration also rebuilds the rollup table
+        chart_data = compute_chart_and_text(
+            event, public=public, profile=profile, rebuild=force
+        )
+        if profile:
+            profile.report(event)
+        store_chart_and_text(event, chart_data, public=public)
+    finally:
+        caches["default"].delete(lock_key)
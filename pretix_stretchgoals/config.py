@@ -0,0 +1,82 @@
+from typing import Optional, Tuple
+
+import pytz
+from dataclasses import dataclass
+from datetime import date, tzinfo
+from django.conf import settings
+from i18nfield.strings import LazyI18nString
+
+from .utils import get_goals
+
+
+def get_currency_places(event):
+    """Return the number of decimal places of the event currency."""
+    return settings.CURRENCY_PLACES.get(event.currency, 2)
+
+
+def parse_item_ids(value):
+    """Return the ids in a stretchgoals_items setting, or () for all items."""
+    return tuple(sorted(int(pk) for pk in (value or "").split(",") if pk))
+
+
+@dataclass(frozen=True)
+class ChartConfig:
+    """
+    The settings the chart data is computed from, read once so that the chart
+    functions do not have to go through the settings of the event each time.
+    """
+
+    __slots__ = (
+        "timezone",
+        "places",
+        "items",
+        "include_pending",
+        "breakdown",
+        "chart_averages",
+        "chart_totals",
+        "resolution",
+        "start_date",
+        "end_date",
+        "min_orders",
+        "forecast",
+        "static_charts",
+        "public_text",
+        "goals",
+    )
+
+    timezone: tzinfo
+    places: int
+    items: Tuple[int, ...]
+    include_pending: bool
+    breakdown: bool
+    chart_averages: bool
+    chart_totals: bool
+    resolution: str
+    start_date: Optional[date]
+    end_date: Optional[date]
+    min_orders: Optional[int]
+    forecast: bool
+    static_charts: bool
+    public_text: LazyI18nString
+    goals: Tuple[dict, ...]
+
+
+def get_config(event):
+    settings = event.settings
+    return ChartConfig(
+        timezone=pytz.timezone(settings.timezone),
+        places=get_currency_places(event),
+        items=parse_item_ids(settings.get("stretchgoals_items")),
+        include_pending=settings.stretchgoals_include_pending or False,
+        breakdown=settings.stretchgoals_breakdown or False,
+        chart_averages=settings.stretchgoals_chart_averages or False,
+        chart_totals=settings.stretchgoals_chart_totals or False,
+        resolution=settings.stretchgoals_resolution,
+        start_date=settings.get("stretchgoals_start_date", as_type=date),
+        end_date=settings.get("stretchgoals_end_date", as_type=date),
+        min_orders=settings.get("stretchgoals_min_orders", as_type=int),
+        forecast=settings.stretchgoals_forecast or False,
+        static_charts=settings.stretchgoals_static_charts or False,
+        public_text=settings.get("stretchgoals_public_text", as_type=LazyI18nString),
+        goals=tuple(get_goals(event)),
+    )
@@ -0,0 +1,185 @@
+import json
+from collections import OrderedDict
+from django.utils.translation import gettext_lazy as _, pgettext_lazy
+from pretix.base.exporter import MultiSheetListExporter
+
+from .chart import (
+    get_breakdown_totals, get_cumulative_prices, get_end_date, get_sale_stats,
+    get_start_date, get_stored_daily_totals,
+)
+from .config import get_config, get_currency_places
+from .json import ChartJSONEncoder
+from .payload import from_cents
+
+
+class StretchgoalsExporter(MultiSheetListExporter):
+    """
+    Export the daily series of the stretch goal chart, and the same series per
+    item and per subevent. Rows are generated one at a time from the daily
+    totals the chart is built from, so the memory needed only depends on the
+    number of days and items, not on the number of positions.
+    """
+
+    identifier = "stretchgoals"
+    verbose_name = _("Stretch goal progress")
+    category = pgettext_lazy("export_category", "Analysis")
+    description = _(
+        "Download the daily revenue and average price counted towards your stretch "
+        "goals, in total and per product."
+    )
+    repeatable_read = False
+    json_keys = {
+        "daily": (
+            "date", "count", "total", "cumulative_count", "cumulative_total", "average",
+        ),
+        "items": (
+            "date", "item", "item_name", "count", "total", "cumulative_count",
+            "cumulative_total", "average",
+        ),
+        "subevents": (
+            "date", "subevent", "subevent_name", "count", "total", "cumulative_count",
+            "cumulative_total", "average",
+        ),
+    }
+
+    @property
+    def sheets(self):
+        sheets = [
+            ("daily", _("Daily totals")),
+            ("items", _("Daily totals per product")),
+        ]
+        if self.event.has_subevents:
+            sheets.append(("subevents", _("Daily totals per date")))
+        return sheets
+
+    @property
+    def export_form_fields(self):
+        fields = super().export_form_fields
+        fields["_format"].choices = list(fields["_format"].choices) + [
+            ("json", _("JSON")),
+        ]
+        return fields
+
+    def get_filename(self):
+        return "{}_stretchgoals".format(self.event.slug)
+
+    def get_range(self, config):
+        stats = get_sale_stats(self.event, config)
+        return get_start_date(config, stats), get_end_date(config, stats)
+
+    def iterate_series(self, config, daily_totals):
+        """Yield (day, count, total, cumulative count, cumulative total, average)."""
+        cumulative_count = 0
+        for (day, count, total), (_day, average, cumulative_total) in zip(
+            daily_totals, get_cumulative_prices(daily_totals)
+        ):
+            cumulative_count += count
+            yield (
+                day,
+                count,
+                from_cents(total, config.places),
+                cumulative_count,
+                from_cents(cumulative_total, config.places),
+                from_cents(average, config.places),
+            )
+
+    def iterate_daily(self, form_data):
+        config = get_config(self.event)
+        goals = config.goals
+        start_date, end_date = self.get_range(config)
+        daily_totals = get_stored_daily_totals(
+            self.event, config, start_date, end_date
+        )
+        yield self.ProgressSetTotal(total=len(daily_totals))
+        yield [
+            _("Date"),
+            _("Positions"),
+            _("Revenue"),
+            _("Positions (cumulative)"),
+            _("Revenue (cumulative)"),
+            _("Average price"),
+        ] + [
+            _("Goal reached: {goal} (%)").format(goal=goal["name"]) for goal in goals
+        ]
+        for row in self.iterate_series(config, daily_totals):
+            cumulative_total = row[4]
+            yield list(row) + [
+                round(cumulative_total / goal["total"] * 100, 2) if goal["total"] else None
+                for goal in goals
+            ]
+
+    def iterate_breakdown(self, kind, columns):
+        config = get_config(self.event)
+        start_date, end_date = self.get_range(config)
+        daily_totals, breakdown = get_breakdown_totals(
+            self.event, config, start_date, end_date
+        )
+        days = [day for day, count, total in daily_totals]
+        series = breakdown[kind]
+        if kind == "items":
+            objects = self.event.items.filter(pk__in=series)
+        else:
+            objects = self.event.subevents.filter(pk__in=series)
+        names = {obj.pk: str(obj) for obj in objects}
+        yield self.ProgressSetTotal(total=len(series) * len(days))
+        yield [
+            _("Date"),
+            *columns,
+            _("Positions"),
+            _("Revenue"),
+            _("Positions (cumulative)"),
+            _("Revenue (cumulative)"),
+            _("Average price"),
+        ]
+        for pk in sorted(series):
+            counts, totals = series[pk]
+            for day, *row in self.iterate_series(
+                config, list(zip(days, counts, totals))
+            ):
+                yield [day, pk, names.get(pk, "")] + row
+
+    def iterate_items(self, form_data):
+        yield from self.iterate_breakdown("items", (_("Product ID"), _("Product")))
+
+    def iterate_subevents(self, form_data):
+        yield from self.iterate_breakdown("subevents", (_("Date ID"), _("Date")))
+
+    def iterate_json(self, form_data):
+        """Yield the JSON document in chunks, one row at a time."""
+        places = get_currency_places(self.event)
+        yield "{"
+        for index, (sheet, label) in enumerate(self.sheets):
+            yield "{}{}: [".format("," if index else "", json.dumps(sheet))
+            keys = self.json_keys[sheet]
+            lines = (
+                line
+                for line in self.iterate_sheet(form_data, sheet)
+                if not isinstance(line, self.ProgressSetTotal)
+            )
+            next(lines)  # the human readable header
+            for row_index, line in enumerate(lines):
+                row = OrderedDict(zip(keys, line))
+                # Any further columns are the progress towards each goal
+                for goal_index, value in enumerate(line[len(keys):]):
+                    row["goal_{}".format(goal_index + 1)] = value
+                yield "{}\n{}".format(
+                    "," if row_index else "",
+                    json.dumps(row, cls=ChartJSONEncoder, places=places),
+                )
+            yield "]"
+        yield "}"
+
+    def render(self, form_data, output_file=None):
+        if form_data.get("_format") != "json":
+            return super().render(form_data, output_file=output_file)
+        filename = self.get_filename() + ".json"
+        if output_file:
+            binary = "b" in getattr(output_file, "mode", "b")
+            for chunk in self.iterate_json(form_data):
+                output_file.write(chunk.encode() if binary else chunk)
+            return filename, "application/json", None
+        return (
+            filename,
+            "application/json",
+            "".join(self.iterate_json(form_data)).encode(),
+        )
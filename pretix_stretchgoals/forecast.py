@@ -0,0 +1,246 @@
+"""
+Forecasts of the cumulative revenue, fitted to the daily totals the chart is
+built from, so that no further database queries are needed. The fits are
+vectorised with NumPy if it is installed, and fall back to plain Python
+otherwise.
+"""
+import math
+from datetime import timedelta
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+MIN_DAYS = 7  # fewer days of data do not make for a meaningful forecast
+FORECAST_DAYS = 30  # forecast range if the event has started already
+MAX_FORECAST_DAYS = 365
+Z_SCORE = 1.96  # 95% confidence band
+LOGISTIC_CAPACITIES = (1.05, 1.1, 1.25, 1.5, 2, 3, 5, 10)
+MAX_EXPONENT = 700  # math.exp overflows shortly after
+MAX_GROWTH = 10  # forecasts never exceed this multiple of the current total
+
+
+def linear_fit(x, y):
+    """Least squares fit of y = intercept + slope * x. Returns (intercept, slope)."""
+    if numpy is not None:
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        x_mean, y_mean = x.mean(), y.mean()
+        sxx = ((x - x_mean) ** 2).sum()
+        slope = ((x - x_mean) * (y - y_mean)).sum() / sxx if sxx else 0.0
+        return float(y_mean - slope * x_mean), float(slope)
+    x_mean, y_mean = sum(x) / len(x), sum(y) / len(y)
+    sxx = sum((value - x_mean) ** 2 for value in x)
+    slope = (
+        sum((a - x_mean) * (b - y_mean) for a, b in zip(x, y)) / sxx if sxx else 0.0
+    )
+    return y_mean - slope * x_mean, slope
+
+
+def clip(value):
+    if numpy is not None:
+        return numpy.minimum(value, MAX_EXPONENT)
+    return min(value, MAX_EXPONENT)
+
+
+class Model:
+    """A fitted growth curve; subclasses define the curve and its inverse."""
+
+    name = None
+    parameters = 2
+
+    def __init__(self, intercept, slope):
+        self.intercept = intercept
+        self.slope = slope
+
+    def evaluate(self, x, exp):
+        raise NotImplementedError()
+
+    def solve(self, target):
+        """Return the x at which the curve reaches target, or None if it never does."""
+        raise NotImplementedError()
+
+    def predict(self, x):
+        if numpy is not None:
+            return self.evaluate(numpy.asarray(x, dtype=float), numpy.exp)
+        return [self.evaluate(value, math.exp) for value in x]
+
+    def get_sse(self, x, y):
+        if numpy is not None:
+            residuals = self.predict(x) - numpy.asarray(y, dtype=float)
+            return float((residuals**2).sum())
+        return sum((a - b) ** 2 for a, b in zip(self.predict(x), y))
+
+
+class LinearModel(Model):
+    name = "linear"
+
+    @classmethod
+    def fit(cls, x, y):
+        return cls(*linear_fit(x, y))
+
+    def evaluate(self, x, exp):
+        return self.intercept + self.slope * x
+
+    def solve(self, target):
+        if self.slope <= 0:
+            return None
+        return (target - self.intercept) / self.slope
+
+
+class ExponentialModel(Model):
+    name = "exponential"
+
+    @classmethod
+    def fit(cls, x, y):
+        points = [(a, math.log(b)) for a, b in zip(x, y) if b > 0]
+        if len(points) < 2:
+            return None
+        return cls(*linear_fit(*zip(*points)))
+
+    def evaluate(self, x, exp):
+        return exp(clip(self.intercept + self.slope * x))
+
+    def solve(self, target):
+        if self.slope <= 0 or target <= 0:
+            return None
+        return (math.log(target) - self.intercept) / self.slope
+
+
+class LogisticModel(Model):
+    """An S-curve approaching the given capacity, fitted via its logit."""
+
+    name = "logistic"
+    parameters = 3
+
+    def __init__(self, intercept, slope, capacity):
+        super().__init__(intercept, slope)
+        self.capacity = capacity
+
+    @classmethod
+    def fit(cls, x, y, capacity):
+        points = [
+            (a, math.log(b / (capacity - b))) for a, b in zip(x, y) if 0 < b < capacity
+        ]
+        if len(points) < 2:
+            return None
+        return cls(*linear_fit(*zip(*points)), capacity)
+
+    def evaluate(self, x, exp):
+        return self.capacity / (1 + exp(clip(-(self.intercept + self.slope * x))))
+
+    def solve(self, target):
+        if self.slope <= 0 or not 0 < target < self.capacity:
+            return None
+        return (math.log(target / (self.capacity - target)) - self.intercept) / self.slope
+
+
+def get_best_fit(x, y, end=None):
+    """
+    Fit all models and return the one with the lowest Akaike information
+    criterion, which keeps the logistic curve from winning by its extra
+    parameter alone. With end, models that grow beyond MAX_GROWTH times the
+    last value by then are left out, unless no model stays below.
+    """
+    linear = LinearModel.fit(x, y)
+    candidates = [linear, ExponentialModel.fit(x, y)] + [
+        LogisticModel.fit(x, y, max(y) * factor) for factor in LOGISTIC_CAPACITIES
+    ]
+    if end is not None:
+        candidates = [
+            model
+            for model in candidates
+            if model is not None
+            and float(model.predict([end])[0]) <= y[-1] * MAX_GROWTH
+        ] or [linear]
+    best, best_score = None, None
+    for model in candidates:
+        if model is None:
+            continue
+        sse = model.get_sse(x, y)
+        score = len(x) * math.log(sse / len(x) + 1e-9) + 2 * model.parameters
+        if best_score is None or score < best_score:
+            best, best_score = model, score
+    return best, best.get_sse(x, y)
+
+
+def get_forecast(daily_totals, targets, event_date=None):
+    """
+    Fit the cumulative revenue of the daily (date, count, cents) buckets and
+    forecast it up to the event date, or for FORECAST_DAYS if the event has
+    started already. Returns None if there is not enough data, otherwise the
+    name of the model, the forecast series in cents with its confidence band,
+    the projected total at the end of the series, and the projected completion
+    date of each target in cents (None if it has been met or is out of reach).
+    """
+    if len(daily_totals) < MIN_DAYS:
+        return None
+    first_day, last_day = daily_totals[0][0], daily_totals[-1][0]
+    x = list(range(len(daily_totals)))
+    y = []
+    total = 0.0
+    for day, count, day_total in daily_totals:
+        total += float(day_total)
+        y.append(total)
+    if total <= 0:
+        return None
+
+    if event_date and event_date > last_day:
+        end_day = min(event_date, last_day + timedelta(days=MAX_FORECAST_DAYS))
+    else:
+        end_day = last_day + timedelta(days=FORECAST_DAYS)
+    future = list(range(len(x), len(x) + (end_day - last_day).days))
+    # Steep early sales would otherwise be extrapolated beyond any measure
+    ceiling = y[-1] * MAX_GROWTH
+
+    model, sse = get_best_fit(x, y, end=future[-1])
+    degrees = len(x) - model.parameters
+    sigma = math.sqrt(sse / degrees) if degrees > 0 else 0.0
+    x_mean = sum(x) / len(x)
+    sxx = sum((value - x_mean) ** 2 for value in x)
+    predicted = [float(value) for value in model.predict(future)]
+    data = [
+        {
+            "date": last_day.strftime("%Y-%m-%d"),
+            "forecast": round(y[-1]),
+            "lower": round(y[-1]),
+            "upper": round(y[-1]),
+        }
+    ]
+    for offset, value in zip(future, predicted):
+        # Revenue does not shrink, so the band never drops below today's total
+        value = min(max(value, y[-1]), ceiling)
+        spread = (
+            Z_SCORE * sigma * math.sqrt(1 + 1 / len(x) + (offset - x_mean) ** 2 / sxx)
+        )
+        data.append(
+            {
+                "date": (first_day + timedelta(days=offset)).strftime("%Y-%m-%d"),
+                "forecast": round(value),
+                "lower": round(max(value - spread, y[-1])),
+                "upper": round(min(value + spread, ceiling)),
+            }
+        )
+
+    goal_dates = []
+    for target in targets:
+        offset = model.solve(target) if y[-1] < target <= ceiling else None
+        if offset is None or offset > len(x) + MAX_FORECAST_DAYS:
+            goal_dates.append(None)
+            continue
+        goal_dates.append(
+            max(
+                first_day + timedelta(days=math.ceil(offset)),
+                last_day + timedelta(days=1),
+            )
+        )
+    return {
+        "model": model.name,
+        "data": data,
+        "projected_total": data[-1]["forecast"],
+        "projected_lower": data[-1]["lower"],
+        "projected_upper": data[-1]["upper"],
+        "projected_date": end_day,
+        "goal_dates": goal_dates,
+    }
@@ -1,6 +1,5 @@
 import json
 from django import forms
-from django.db.models.query import QuerySet
 from django.utils.translation import gettext_lazy as _
 from django_scopes.forms import SafeModelMultipleChoiceField
 from i18nfield.forms import (
@@ -8,9 +7,13 @@ from i18nfield.forms import (
 )
 from pretix.base.forms import SettingsForm
 from pretix.base.forms.widgets import DatePickerWidget
-from pretix.base.models import Item
+from pretix.base.models import Event, Item
 
-from .utils import get_goals, set_goals
+from .batch import get_stretchgoals_events
+from .config import parse_item_ids
+from .utils import (
+    get_campaigns, get_goals, invalidate_cache, set_campaigns, set_goals,
+)
 
 
 class StretchgoalsSettingsForm(I18nForm, SettingsForm):
@@ -77,6 +80,45 @@ class StretchgoalsSettingsForm(I18nForm, SettingsForm):
         label=_("Generate total revenue graph"),
         help_text=_("This graph shows the total revenue over time."),
     )
+    stretchgoals_forecast = forms.BooleanField(
+        required=False,
+        label=_("Show forecast"),
+        help_text=_(
+            "Extends the total revenue graph by a forecast based on the sales so far, "
+            "and estimates when each goal will be reached."
+        ),
+    )
+    stretchgoals_resolution = forms.ChoiceField(
+        required=False,
+        label=_("Graph resolution"),
+        choices=(
+            ("hour", _("One point per hour")),
+            ("day", _("One point per day")),
+            ("week", _("One point per week")),
+            ("auto", _("Automatic")),
+        ),
+        help_text=_(
+            "The automatic resolution shows hourly points for short ranges, and "
+            "reduces long ranges to a limited number of points."
+        ),
+    )
+    stretchgoals_static_charts = forms.BooleanField(
+        required=False,
+        label=_("Render graphs on the server"),
+        help_text=_(
+            "The graphs are drawn as images whenever the statistics are generated, so "
+            "the public page does not need JavaScript to show them. They are not "
+            "interactive."
+        ),
+    )
+    stretchgoals_breakdown = forms.BooleanField(
+        required=False,
+        label=_("Generate revenue graphs per item and date"),
+        help_text=_(
+            "These graphs break the total revenue down by item and, for event series, "
+            "by date. They are only shown in the backend."
+        ),
+    )
     stretchgoals_min_orders = forms.IntegerField(
         required=False,
         label=_("Minimal number of orders"),
@@ -99,20 +141,12 @@ class StretchgoalsSettingsForm(I18nForm, SettingsForm):
         self.event = kwargs.pop("event")
         super().__init__(*args, **kwargs)
 
-        initial_items = (
-            self.event.settings.get("stretchgoals_items", as_type=QuerySet) or []
-        )
-        if isinstance(initial_items, str) and initial_items:
-            initial_items = self.event.items.filter(id__in=initial_items.split(","))
-        elif isinstance(initial_items, list):
-            initial_items = self.event.items.filter(
-                id__in=[i.pk for i in initial_items]
-            )
-
         self.fields["stretchgoals_items"].queryset = Item.objects.filter(
             event=self.event
         )
-        self.initial["stretchgoals_items"] = initial_items
+        self.initial["stretchgoals_items"] = self.event.items.filter(
+            pk__in=parse_item_ids(self.event.settings.get("stretchgoals_items"))
+        )
         self.goals = get_goals(self.event)
 
     def _save_new_goal(self):
@@ -128,11 +162,80 @@ class StretchgoalsSettingsForm(I18nForm, SettingsForm):
 
     def save(self, *args, **kwargs):
         self._save_new_goal()
-        self.event.settings._h.add_type(
-            QuerySet,
-            lambda queryset: ",".join([str(element.pk) for element in queryset]),
-            lambda pk_list: Item.objects.filter(
-                pk__in=list(filter(None, pk_list.split(",")))
-            ),
-        )
         super().save(*args, **kwargs)
+        # The settings are part of the cache key, but data cached for the same
+        # settings earlier may have missed order changes in the meantime.
+        invalidate_cache(self.event)
+
+
+class CampaignForm(I18nForm):
+    name = I18nFormField(required=True, label=_("Name"), widget=I18nTextInput)
+    events = SafeModelMultipleChoiceField(
+        queryset=Event.objects.none(),
+        label=_("Events"),
+        help_text=_(
+            "The revenue of these events is counted towards the goals, each with the "
+            "items and timespan configured in its own stretch goal settings."
+        ),
+        widget=forms.CheckboxSelectMultiple,
+    )
+    new_name = I18nFormField(
+        required=False, label=_("New goal's name"), widget=I18nTextInput
+    )
+    new_total = forms.IntegerField(
+        required=False, min_value=0, label=_("New total revenue goal")
+    )
+    new_amount = forms.IntegerField(
+        required=False, min_value=0, label=_("New goal's amount of items to be sold")
+    )
+    new_description = I18nFormField(
+        required=False, label=_("New goal's description"), widget=I18nTextarea
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.organizer = kwargs.pop("organizer")
+        self.campaign = kwargs.pop("campaign", None)
+        kwargs["locales"] = self.organizer.settings.get("locales")
+        if self.campaign:
+            kwargs["initial"] = {
+                "name": self.campaign["name"],
+                "events": self.campaign["events"],
+            }
+        super().__init__(*args, **kwargs)
+        self.fields["events"].queryset = get_stretchgoals_events(
+            self.organizer
+        ).order_by("-date_from")
+        self.goals = self.campaign["goals"] if self.campaign else []
+
+    def clean_events(self):
+        events = self.cleaned_data["events"]
+        if len({event.currency for event in events}) > 1:
+            raise forms.ValidationError(
+                _("All events of a campaign need to use the same currency.")
+            )
+        return events
+
+    def save(self):
+        """Store the campaign and return it, with a new id if it was added."""
+        campaigns = get_campaigns(self.organizer)
+        campaign = next(
+            (c for c in campaigns if self.campaign and c["id"] == self.campaign["id"]),
+            None,
+        )
+        if campaign is None:
+            campaign = {
+                "id": max((c["id"] for c in campaigns), default=0) + 1,
+                "goals": [],
+            }
+            campaigns.append(campaign)
+        campaign["name"] = self.cleaned_data["name"]
+        campaign["events"] = sorted(event.pk for event in self.cleaned_data["events"])
+        if self.cleaned_data["new_total"]:
+            campaign["goals"].append(
+                {
+                    item: self.cleaned_data["new_{}".format(item)]
+                    for item in ["name", "total", "amount", "description"]
+                }
+            )
+        set_campaigns(self.organizer, campaigns)
+        return campaign
@@ -3,7 +3,13 @@ from django.core.serializers.json import DjangoJSONEncoder
 
 
 class ChartJSONEncoder(DjangoJSONEncoder):
+    """Encodes Decimals as floats, rounded to the places of the event currency."""
+
+    def __init__(self, *args, places=2, **kwargs):
+        self.places = places
+        super().__init__(*args, **kwargs)
+
     def default(self, obj):
         if isinstance(obj, decimal.Decimal):
-            return round(float(obj), 2)
+            return round(float(obj), self.places)
         return super().default(obj)
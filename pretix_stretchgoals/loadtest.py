@@ -0,0 +1,134 @@
+"""
+A load test for the public stretch goal endpoints. Concurrent clients request
+the same page through Django's test client, each in its own thread with its own
+database connection, while the cache is empty (cold), filled (warm) or outdated
+(stale). Synthetic events are committed to the database for the threads to see
+them, and deleted again afterwards.
+"""
+import math
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from pretix.base.models import Order, OrderPayment, OrderPosition
+from pretix.multidomain.urlreverse import eventreverse
+from time import perf_counter
+
+from .benchmark import timed
+from .chart import refresh_chart_and_text
+from .profiling import collect_cache_results
+from .utils import invalidate_cache
+
+ENDPOINTS = {
+    "page": "plugins:pretix_stretchgoals:public",
+    "data": "plugins:pretix_stretchgoals:public.data",
+    "widget": "plugins:pretix_stretchgoals:widget",
+}
+PHASES = ("cold", "warm", "stale")
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "stretchgoals-loadtest",
+    }
+}
+
+
+def delete_synthetic_event(event):
+    """Delete an event created by benchmark.create_synthetic_event, and its organizer."""
+    organizer = event.organizer
+    with transaction.atomic():
+        OrderPayment.objects.filter(order__event=event).delete()
+        OrderPosition.all.filter(order__event=event).delete()
+        Order.objects.filter(event=event).delete()
+        organizer.delete_sub_objects()
+        organizer.delete()
+
+
+def percentile(values, share):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values), max(math.ceil(share * len(values)), 1)) - 1]
+
+
+def request_url(url, count, barrier):
+    """
+    Request the URL count times with a client of its own, after all clients are
+    ready. Returns a list of (duration, query count, status code) tuples.
+    """
+    client = Client()
+    results = []
+    try:
+        barrier.wait()
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as queries:
+                response, duration = timed(client.get, url)
+            results.append(
+                (duration, len(queries.captured_queries), response.status_code)
+            )
+    finally:
+        connection.close()
+    return results
+
+
+def run_phase(url, requests=200, concurrency=20):
+    """
+    Send the requests from concurrent clients, all starting at the same time,
+    and summarise latencies, queries and cache lookups.
+    """
+    concurrency = max(min(concurrency, requests), 1)
+    counts = [
+        requests // concurrency + (1 if index < requests % concurrency else 0)
+        for index in range(concurrency)
+    ]
+    barrier = threading.Barrier(concurrency)
+    with collect_cache_results() as lookups:
+        started = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [
+                pool.submit(request_url, url, count, barrier) for count in counts
+            ]
+            results = [result for future in futures for result in future.result()]
+        duration = perf_counter() - started
+    durations = [duration for duration, queries, status in results]
+    queries = [queries for duration, queries, status in results]
+    return {
+        "requests": len(results),
+        "duration": duration,
+        "throughput": len(results) / duration if duration else 0,
+        "p50": percentile(durations, 0.5),
+        "p99": percentile(durations, 0.99),
+        "queries": sum(queries) / len(queries) if queries else 0,
+        "max_queries": max(queries, default=0),
+        "hit_rate": lookups["hit"] / sum(lookups.values()) if lookups else 0,
+        "lookups": dict(lookups),
+        "statuses": dict(Counter(status for duration, queries, status in results)),
+    }
+
+
+def prepare_phase(event, phase):
+    if phase == "cold":
+        event.cache.clear()
+    elif phase == "warm":
+        # A celery worker may still be busy with the data the cold phase queued
+        refresh_chart_and_text(event, public=True)
+    elif phase == "stale":
+        invalidate_cache(event)
+
+
+def run_loadtest(event, endpoint="page", requests=200, concurrency=20, phases=PHASES):
+    """
+    Run the given phases against an event with public goals, in order, and
+    return a dict of their summaries, see run_phase. Every phase starts from the
+    cache state the previous one left behind: the warm phase is served from the
+    data the cold one generated, the stale phase from outdated data.
+    """
+    url = eventreverse(event, ENDPOINTS[endpoint])
+    results = {}
+    for phase in phases:
+        prepare_phase(event, phase)
+        results[phase] = run_phase(url, requests=requests, concurrency=concurrency)
+    return results
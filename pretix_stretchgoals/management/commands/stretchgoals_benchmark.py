@@ -0,0 +1,143 @@
+from bisect import bisect_left
+from dataclasses import replace
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPosition
+
+from ...benchmark import (
+    configure_event, create_synthetic_event, get_legacy_range_queryset,
+    run_benchmark, timed,
+)
+from ...chart import (
+    get_daily_totals, get_date_range, get_day_end, get_day_start, get_end_date,
+    get_range_queryset, get_sale_stats, get_start_date,
+)
+from ...config import get_config
+from ...payload import to_cents
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the stretch goal chart generation on a synthetic event. All "
+        "generated data is rolled back afterwards. Exits with an error if one of "
+        "the given query or time limits is exceeded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=40000)
+        parser.add_argument("--positions-per-order", type=int, default=3)
+        parser.add_argument("--days", type=int, default=120)
+        parser.add_argument("--payment-spread", type=int, default=3)
+        parser.add_argument("--items", type=int, default=3)
+        parser.add_argument(
+            "--filter-items",
+            type=int,
+            default=0,
+            help="Only count this many of the items towards the goals",
+        )
+        parser.add_argument("--include-pending", action="store_true")
+        parser.add_argument(
+            "--max-queries",
+            type=int,
+            help="Fail if a cold or warm render needs more queries",
+        )
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            help="Fail if a cold or warm render takes longer",
+        )
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="Compare the query plans with the former correlated subquery",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with scopes_disabled(), transaction.atomic():
+                event, duration = timed(
+                    create_synthetic_event,
+                    orders=options["orders"],
+                    positions_per_order=options["positions_per_order"],
+                    days=options["days"],
+                    payment_spread=options["payment_spread"],
+                    items=options["items"],
+                )
+                self.stdout.write(
+                    "Created {} positions in {:.1f}s".format(
+                        OrderPosition.objects.filter(order__event=event).count(),
+                        duration,
+                    )
+                )
+                configure_event(
+                    event,
+                    include_pending=options["include_pending"],
+                    filter_items=options["filter_items"],
+                )
+                results = run_benchmark(event)
+                if options["explain"]:
+                    self.explain(event)
+                raise Rollback()
+        except Rollback:
+            pass
+
+        failures = []
+        for name, (duration, queries) in results.items():
+            self.stdout.write(
+                "{:<7} {:8.3f}s {:5d} queries".format(name, duration, queries)
+            )
+            if name == "cached":
+                continue
+            if options["max_queries"] is not None and queries > options["max_queries"]:
+                failures.append(
+                    "{} render used {} queries".format(name, queries)
+                )
+            if options["max_seconds"] is not None and duration > options["max_seconds"]:
+                failures.append(
+                    "{} render took {:.3f}s".format(name, duration)
+                )
+        if failures:
+            raise CommandError("Benchmark limits exceeded: " + ", ".join(failures))
+
+    def explain(self, event):
+        # The legacy queryset counts all items of paid orders
+        config = replace(get_config(event), items=(), include_pending=False)
+        tz = config.timezone
+        stats = get_sale_stats(event, config)
+        start_date = get_start_date(config, stats)
+        end_date = get_end_date(config, stats)
+        start_dt = get_day_start(start_date, tz)
+        end_dt = get_day_end(end_date, tz)
+
+        legacy = get_legacy_range_queryset(event, start_dt, end_dt)
+        current = get_range_queryset(event, config, start_date, end_date)
+        self.stdout.write("\nCorrelated subquery per position:\n")
+        self.stdout.write(legacy.explain())
+        self.stdout.write("\nPayment dates resolved per order:\n")
+        self.stdout.write(current.explain())
+
+        def legacy_daily_totals():
+            day_ends = [get_day_end(day, tz) for day in get_date_range(start_date, end_date)]
+            totals = [0] * len(day_ends)
+            for timestamp, price in legacy.values_list("payment_date", "price").iterator():
+                # get_daily_totals sums up cents, see payload
+                totals[bisect_left(day_ends, timestamp)] += to_cents(price, config.places)
+            return totals
+
+        legacy_totals, legacy_duration = timed(legacy_daily_totals)
+        current_totals, current_duration = timed(
+            get_daily_totals, event, config, start_date, end_date
+        )
+        if legacy_totals != [total for day, count, total in current_totals]:
+            self.stderr.write("The strategies returned different results!")
+        self.stdout.write(
+            "\nDaily totals over {} days: {:.3f}s with the correlated subquery, "
+            "{:.3f}s with per-order payment dates\n".format(
+                len(current_totals), legacy_duration, current_duration
+            )
+        )
@@ -0,0 +1,141 @@
+from contextlib import nullcontext
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django_scopes import scopes_disabled
+from pretix.base.models import Event
+
+from ...benchmark import configure_event, create_synthetic_event, timed
+from ...loadtest import (
+    ENDPOINTS, LOCMEM_CACHES, PHASES, delete_synthetic_event, run_loadtest,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the public stretch goal page with concurrent clients while the "
+        "cache is cold, warm and stale, on synthetic events of the given sizes or "
+        "on an existing event. Exits with an error if one of the given limits is "
+        "exceeded by the warm phase."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1000,10000",
+            help="Comma-separated numbers of orders of the synthetic events",
+        )
+        parser.add_argument(
+            "--event",
+            help="Test the existing event <organizer>/<event> instead, which keeps its data",
+        )
+        parser.add_argument("--days", type=int, default=120)
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="page")
+        parser.add_argument(
+            "--phases",
+            default=",".join(PHASES),
+            help="Comma-separated phases to run, in order",
+        )
+        parser.add_argument(
+            "--cache",
+            choices=("configured", "locmem"),
+            default="configured",
+            help="Use the configured cache (e.g. a local redis) or an in-process stand-in",
+        )
+        parser.add_argument(
+            "--max-queries",
+            type=int,
+            help="Fail if a warm request needs more queries",
+        )
+        parser.add_argument(
+            "--max-p99",
+            type=float,
+            help="Fail if the 99th percentile of warm requests takes longer (seconds)",
+        )
+
+    def handle(self, *args, **options):
+        phases = [phase for phase in options["phases"].split(",") if phase]
+        unknown = set(phases) - set(PHASES)
+        if unknown:
+            raise CommandError("Unknown phases: {}".format(", ".join(sorted(unknown))))
+        if options["cache"] == "locmem":
+            cache_context = override_settings(CACHES=LOCMEM_CACHES)
+        else:
+            cache_context = nullcontext()
+        with cache_context, scopes_disabled():
+            if options["event"]:
+                results = {options["event"]: self.run_event(options, phases)}
+            else:
+                results = {
+                    "{} orders".format(size): self.run_synthetic(
+                        int(size), options, phases
+                    )
+                    for size in options["sizes"].split(",")
+                    if size
+                }
+
+        failures = []
+        for name, phase_results in results.items():
+            self.stdout.write("\n{}".format(name))
+            for phase, result in phase_results.items():
+                self.stdout.write(
+                    "{:<6} p50 {:7.3f}s  p99 {:7.3f}s  {:7.1f} req/s  "
+                    "{:5.1f} queries/req (max {})  hit rate {:4.0%}  {}".format(
+                        phase,
+                        result["p50"],
+                        result["p99"],
+                        result["throughput"],
+                        result["queries"],
+                        result["max_queries"],
+                        result["hit_rate"],
+                        " ".join(
+                            "{}×{}".format(status, count)
+                            for status, count in sorted(result["statuses"].items())
+                        ),
+                    )
+                )
+            warm = phase_results.get("warm")
+            if not warm:
+                continue
+            if options["max_queries"] is not None and warm["max_queries"] > options["max_queries"]:
+                failures.append(
+                    "{}: warm request used {} queries".format(name, warm["max_queries"])
+                )
+            if options["max_p99"] is not None and warm["p99"] > options["max_p99"]:
+                failures.append("{}: warm p99 was {:.3f}s".format(name, warm["p99"]))
+        if failures:
+            raise CommandError("Load test limits exceeded: " + ", ".join(failures))
+
+    def run_event(self, options, phases):
+        organizer, __, slug = options["event"].partition("/")
+        event = Event.objects.filter(organizer__slug=organizer, slug=slug).first()
+        if event is None:
+            raise CommandError("Event {} does not exist".format(options["event"]))
+        if not event.live or not event.settings.stretchgoals_is_public:
+            raise CommandError("The event needs to be live and show its goals publicly")
+        return self.run(event, options, phases)
+
+    def run_synthetic(self, orders, options, phases):
+        # The clients use connections of their own, so the data is committed
+        event, duration = timed(create_synthetic_event, orders=orders, days=options["days"])
+        try:
+            self.stdout.write(
+                "Created an event with {} orders in {:.1f}s".format(orders, duration)
+            )
+            configure_event(event)
+            event.settings.stretchgoals_is_public = True
+            event.live = True
+            event.save()
+            return self.run(event, options, phases)
+        finally:
+            delete_synthetic_event(event)
+
+    def run(self, event, options, phases):
+        return run_loadtest(
+            event,
+            endpoint=options["endpoint"],
+            requests=options["requests"],
+            concurrency=options["concurrency"],
+            phases=phases,
+        )
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django_scopes import scopes_disabled
+from pretix.base.models import Organizer
+
+from ...batch import get_stretchgoals_events, refresh_events
+from ...benchmark import timed
+from ...payload import from_cents
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerate the stretch goal data of all events of an organizer, or of "
+        "the given events, in one batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("organizer", help="Slug of the organizer")
+        parser.add_argument(
+            "--event",
+            action="append",
+            dest="events",
+            default=[],
+            help="Only regenerate the event with this slug (can be given repeatedly)",
+        )
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        try:
+            organizer = Organizer.objects.get(slug=options["organizer"])
+        except Organizer.DoesNotExist:
+            raise CommandError("Organizer {} does not exist".format(options["organizer"]))
+        events = get_stretchgoals_events(organizer)
+        if options["events"]:
+            events = events.filter(slug__in=options["events"])
+            missing = set(options["events"]) - {event.slug for event in events}
+            if missing:
+                raise CommandError(
+                    "Unknown events or plugin not enabled: {}".format(
+                        ", ".join(sorted(missing))
+                    )
+                )
+        results, duration = timed(refresh_events, events)
+        for event, chart_data in results.items():
+            self.stdout.write(
+                "{:<30} total {:>12} avg {:>10}".format(
+                    event.slug,
+                    str(from_cents(chart_data["total_now"], chart_data["places"])),
+                    str(from_cents(chart_data["avg_now"], chart_data["places"])),
+                )
+            )
+        self.stdout.write("Regenerated {} events in {:.1f}s".format(len(results), duration))
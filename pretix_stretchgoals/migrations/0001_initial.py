@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('pretixbase', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('filter_key', models.CharField(max_length=190)),
+                ('date', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('dirty', models.BooleanField(default=False)),
+                ('generation', models.PositiveIntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stretchgoals_daily_totals', to='pretixbase.event')),
+            ],
+            options={
+                'ordering': ('date',),
+                'unique_together': {('event', 'filter_key', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Snapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('filter_key', models.CharField(max_length=190)),
+                ('start', models.DateField(null=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('counts', models.BinaryField()),
+                ('totals', models.BinaryField()),
+                ('digest', models.CharField(max_length=40)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stretchgoals_snapshots', to='pretixbase.event')),
+            ],
+            options={
+                'ordering': ('-created', '-pk'),
+                'indexes': [models.Index(fields=['event', 'created'], name='stretchgoals_snapshot_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import models
+
+
+class DailyTotal(models.Model):
+    """
+    Number and sum of the positions counted towards the stretch goals on one
+    day, for one combination of item filter, pending setting, timezone and
+    currency places. The sum is stored in cents of the event currency, see
+    payload. The generation is increased whenever the day is marked as dirty,
+    so that results computed before are not stored over it.
+    """
+
+    event = models.ForeignKey(
+        "pretixbase.Event",
+        on_delete=models.CASCADE,
+        related_name="stretchgoals_daily_totals",
+    )
+    filter_key = models.CharField(max_length=190)
+    date = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+    dirty = models.BooleanField(default=False)
+    generation = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("date",)
+        unique_together = (("event", "filter_key", "date"),)
+
+
+class Snapshot(models.Model):
+    """
+    The daily totals of an event as they were computed at one regeneration of
+    its chart data, as packed arrays of counts and cents starting at the start
+    date, see payload. Snapshots are only ever added, so that earlier states of
+    the chart can be shown and compared after refunds or payments changed past
+    days. A snapshot is only added if the totals differ from the previous one.
+    """
+
+    event = models.ForeignKey(
+        "pretixbase.Event",
+        on_delete=models.CASCADE,
+        related_name="stretchgoals_snapshots",
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    filter_key = models.CharField(max_length=190)
+    start = models.DateField(null=True)
+    count = models.PositiveIntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+    counts = models.BinaryField()
+    totals = models.BinaryField()
+    digest = models.CharField(max_length=40)
+
+    class Meta:
+        ordering = ("-created", "-pk")
+        indexes = [
+            models.Index(fields=["event", "created"], name="stretchgoals_snapshot_idx")
+        ]
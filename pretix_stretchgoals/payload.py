@@ -0,0 +1,108 @@
+"""
+The compact form in which chart data is cached. Series are stored as packed
+arrays of integer cents, positioned by their offset from a start date, and
+goals only by the numbers computed for them. Everything that depends on the
+request – JSON, goal names, texts in the active locale – is rendered from it
+at response time.
+
+Cents are the smallest unit of the event currency, so for currencies without
+minor units they are whole amounts. Amounts are computed as cents from the
+database onwards and only turned into Decimals or floats when rendered.
+"""
+import struct
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+COMPRESS_THRESHOLD = 1024  # bytes, smaller arrays do not compress well
+RAW = b"r"
+COMPRESSED = b"z"
+
+
+def to_cents(value, places=2):
+    return int(round(value * 10**places))
+
+
+def from_cents(cents, places=2):
+    """Return the amount as a Decimal with the places of the currency."""
+    return Decimal(cents).scaleb(-places)
+
+
+def to_float(cents, places=2):
+    """Return the amount as a float for JSON, which needs no custom encoding."""
+    return cents / 10**places
+
+
+def divide(dividend, divisor):
+    """Divide integers, rounding half to even like round() does for Decimals."""
+    quotient, remainder = divmod(dividend, divisor)
+    if 2 * remainder > divisor or (2 * remainder == divisor and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def compress(data):
+    """Prefix the bytes with their encoding, and compress them if they are large."""
+    if len(data) > COMPRESS_THRESHOLD:
+        return COMPRESSED + zlib.compress(data)
+    return RAW + data
+
+
+def decompress(data):
+    if data[:1] == COMPRESSED:
+        return zlib.decompress(data[1:])
+    return data[1:]
+
+
+def pack_values(values):
+    """Pack a sequence of integers into little-endian int64s."""
+    return compress(struct.pack("<{}q".format(len(values)), *values))
+
+
+def unpack_values(data):
+    data = decompress(data)
+    return struct.unpack("<{}q".format(len(data) // 8), data)
+
+
+def get_offset(start, bucket):
+    """Position of a day, or of an hour (as a datetime), relative to the start day."""
+    if isinstance(bucket, datetime):
+        return (bucket.date() - start).days * 24 + bucket.hour
+    return (bucket - start).days
+
+
+def format_bucket(bucket):
+    if isinstance(bucket, datetime):
+        return bucket.strftime("%Y-%m-%d %H:%M")
+    return bucket.strftime("%Y-%m-%d")
+
+
+def get_label(start, offset, hourly=False):
+    if hourly:
+        day = start + timedelta(days=offset // 24)
+        return "{} {:02d}:00".format(day.strftime("%Y-%m-%d"), offset % 24)
+    return (start + timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+def pack_series(start, buckets, values):
+    """
+    Pack the (bucket, cents) points of a series. Offsets are only stored if the
+    buckets are not contiguous, as with weekly or downsampled series.
+    """
+    offsets = [get_offset(start, bucket) for bucket in buckets]
+    return {
+        "offsets": (
+            None if offsets == list(range(len(offsets))) else pack_values(offsets)
+        ),
+        "values": pack_values(values),
+    }
+
+
+def iterate_series(start, series, hourly=False, places=2):
+    """Yield the (label, amount) points of a packed series, amounts as floats."""
+    values = unpack_values(series["values"])
+    offsets = (
+        unpack_values(series["offsets"]) if series["offsets"] else range(len(values))
+    )
+    for offset, cents in zip(offsets, values):
+        yield get_label(start, offset, hourly), to_float(cents, places)
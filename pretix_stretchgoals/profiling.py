@@ -0,0 +1,119 @@
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from collections import Counter as ResultCounter
+from contextlib import contextmanager, nullcontext
+from django.conf import settings
+from django.db import connection
+from pretix.base.metrics import Counter, Histogram
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+collectors = []  # of ResultCounters, see collect_cache_results
+collectors_lock = threading.Lock()
+
+stretchgoals_phase_duration_seconds = Histogram(
+    "pretix_stretchgoals_phase_duration_seconds",
+    "Time spent in the phases of the stretch goal computation.",
+    ["phase"],
+)
+stretchgoals_cache_lookups_total = Counter(
+    "pretix_stretchgoals_cache_lookups_total",
+    "Lookups of stretch goal data, by result (hit, stale, miss).",
+    ["result"],
+)
+
+
+class Profile:
+    """Wall time and query count per phase of the chart computation."""
+
+    def __init__(self):
+        self.phases = []
+        self.cache_result = None
+
+    @contextmanager
+    def phase(self, name):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = perf_counter()
+        with connection.execute_wrapper(count_query):
+            yield
+        self.phases.append((name, perf_counter() - started, queries))
+
+    @property
+    def duration(self):
+        return sum(duration for name, duration, queries in self.phases)
+
+    @property
+    def queries(self):
+        return sum(queries for name, duration, queries in self.phases)
+
+    def report(self, event):
+        if settings.METRICS_ENABLED:
+            for name, duration, queries in self.phases:
+                stretchgoals_phase_duration_seconds.observe(duration, phase=name)
+        logger.debug(
+            "Computed stretch goals for %s in %.3fs with %d queries (%s)",
+            event.slug,
+            self.duration,
+            self.queries,
+            ", ".join(
+                "{}: {:.3f}s/{}q".format(name, duration, queries)
+                for name, duration, queries in self.phases
+            ),
+        )
+
+
+def get_profile():
+    """Return a Profile if metrics or debug logging are enabled, None otherwise."""
+    if settings.METRICS_ENABLED or logger.isEnabledFor(logging.DEBUG):
+        return Profile()
+
+
+def phase(profile, name):
+    return profile.phase(name) if profile else nullcontext()
+
+
+@contextmanager
+def collect_cache_results():
+    """
+    Count the results of all cache lookups in all threads while the context is
+    active, e.g. for a load test.
+    """
+    results = ResultCounter()
+    with collectors_lock:
+        collectors.append(results)
+    try:
+        yield results
+    finally:
+        with collectors_lock:
+            collectors.remove(results)
+
+
+def count_cache_result(result):
+    if collectors:
+        with collectors_lock:
+            for results in collectors:
+                results[result] += 1
+
+
+def record_cache_result(profile, result):
+    if profile:
+        profile.cache_result = result
+    count_cache_result(result)
+    if settings.METRICS_ENABLED:
+        stretchgoals_cache_lookups_total.inc(result=result)
+
+
+async def arecord_cache_result(result):
+    count_cache_result(result)
+    if settings.METRICS_ENABLED:
+        # The metrics are stored in redis, which is not to block the event loop
+        await sync_to_async(
+            stretchgoals_cache_lookups_total.inc, thread_sensitive=False
+        )(result=result)
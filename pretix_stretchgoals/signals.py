@@ -1,12 +1,30 @@
+from collections import defaultdict
 from django.db.models import QuerySet
 from django.dispatch import receiver
 from django.urls import resolve, reverse
 from django.utils.translation import gettext_lazy as _
+from django_scopes import scopes_disabled
 from i18nfield.strings import LazyI18nString
 from pretix.base.models import Item
 from pretix.base.settings import settings_hierarkey
-from pretix.base.signals import event_copy_data
-from pretix.control.signals import nav_event, nav_event_settings
+from pretix.base.signals import (
+    event_copy_data, order_approved, order_canceled, order_changed,
+    order_denied, order_expired, order_gracefully_delete, order_paid,
+    order_placed, order_reactivated, periodic_task, register_data_exporters,
+)
+from pretix.control.signals import nav_event, nav_event_settings, nav_organizer
+
+from .batch import (
+    get_organizer_events, get_stretchgoals_events, get_variants,
+    schedule_organizer_refresh,
+)
+from .campaigns import schedule_campaign_refresh
+from .chart import mark_order_dirty, schedule_refresh
+from .config import parse_item_ids
+from .utils import (
+    get_campaign_fresh_key, get_campaigns, get_fresh_cache_key,
+    invalidate_cache,
+)
 
 
 @receiver(nav_event, dispatch_uid="stretchgoals_nav")
@@ -55,23 +73,89 @@ def navbar_settings(sender, request, **kwargs):
     ]
 
 
+@receiver(nav_organizer, dispatch_uid="stretchgoals_nav_organizer")
+def navbar_organizer(sender, request, **kwargs):
+    if not get_organizer_events(request).exists():
+        return []
+    url = resolve(request.path_info)
+    return [
+        {
+            "label": _("Stretch Goals"),
+            "icon": "bullseye",
+            "url": reverse(
+                "plugins:pretix_stretchgoals:organizer",
+                kwargs={"organizer": request.organizer.slug},
+            ),
+            "active": url.namespace == "plugins:pretix_stretchgoals"
+            and url.url_name
+            in ("organizer", "campaign", "campaign.add", "campaign.settings"),
+        }
+    ]
+
+
+@receiver(register_data_exporters, dispatch_uid="stretchgoals_exporter")
+def register_exporter(sender, **kwargs):
+    from .exporters import StretchgoalsExporter
+
+    return StretchgoalsExporter
+
+
 @receiver(signal=event_copy_data, dispatch_uid="stretchgoals_copy_data")
 def event_copy_data_receiver(sender, other, item_map, **kwargs):
-    other.settings._h.add_type(
-        QuerySet,
-        lambda queryset: ",".join([str(element.pk) for element in queryset]),
-        lambda pk_list: Item.objects.filter(
-            pk__in=pk_list.split(",") if pk_list else []
-        ),
-    )
-    initial_items = other.settings.get("stretchgoals_items", as_type=QuerySet) or []
-    if isinstance(initial_items, str) and initial_items:
-        initial_items = [int(i) for i in initial_items.split(",")]
-    else:
-        initial_items = [i.pk for i in initial_items]
+    initial_items = parse_item_ids(other.settings.get("stretchgoals_items"))
     sender.settings.stretchgoals_items = ",".join(
         str(item_map.get(i).pk) for i in initial_items if i in item_map
     )
 
 
+@receiver(
+    signal=[
+        order_placed,
+        order_paid,
+        order_canceled,
+        order_reactivated,
+        order_expired,
+        order_changed,
+        order_approved,
+        order_denied,
+        order_gracefully_delete,
+    ],
+    dispatch_uid="stretchgoals_order_updated",
+)
+def order_updated_receiver(sender, order, **kwargs):
+    mark_order_dirty(order)
+    invalidate_cache(sender)
+
+
+@receiver(signal=periodic_task, dispatch_uid="stretchgoals_periodic_refresh")
+@scopes_disabled()
+def refresh_chart_data_periodic(sender, **kwargs):
+    outdated = defaultdict(list)
+    organizers = set()
+    for event in get_stretchgoals_events().filter(live=True):
+        organizers.add(event.organizer)
+        fresh_keys = [
+            get_fresh_cache_key(event, public) for public in get_variants(event)
+        ]
+        if len(event.cache.get_many(fresh_keys)) < len(fresh_keys):
+            outdated[event.organizer].append(event)
+    for organizer, events in outdated.items():
+        if len(events) == 1:
+            for public in get_variants(events[0]):
+                schedule_refresh(events[0], public=public)
+        else:
+            schedule_organizer_refresh(organizer, events)
+    for organizer in organizers:
+        for campaign in get_campaigns(organizer):
+            if not organizer.cache.get(get_campaign_fresh_key(campaign)):
+                schedule_campaign_refresh(organizer, campaign)
+
+
+# The types are shared by all settings objects, so they are only registered once
+settings_hierarkey.add_type(
+    QuerySet,
+    lambda queryset: ",".join([str(element.pk) for element in queryset]),
+    lambda pk_list: Item.objects.filter(pk__in=parse_item_ids(pk_list)),
+)
 settings_hierarkey.add_default("stretchgoals_public_text", "", LazyI18nString)
+settings_hierarkey.add_default("stretchgoals_resolution", "day", str)
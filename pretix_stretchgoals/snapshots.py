@@ -0,0 +1,121 @@
+"""
+The snapshot history of an event: the daily totals as they were computed at
+each regeneration, see models.Snapshot. Charts as of an earlier point in time
+are built from a snapshot alone, without reading any positions.
+"""
+from dataclasses import replace
+from datetime import datetime, time, timedelta
+
+from .chart import build_chart_and_text, get_filter_key, get_resolution
+from .config import get_config
+from .models import Snapshot
+from .payload import from_cents, unpack_values
+
+MAX_SNAPSHOTS = 100  # shown in the history
+
+
+def get_snapshots(event):
+    return event.stretchgoals_snapshots.defer("counts", "totals")[:MAX_SNAPSHOTS]
+
+
+def get_snapshot(event, pk):
+    if not str(pk).isdigit():
+        return None
+    return Snapshot.objects.filter(event=event, pk=pk).first()
+
+
+def get_snapshot_as_of(event, day, config):
+    """
+    Return the latest snapshot taken before the end of the given day that
+    counts the same positions as the given config, see chart.get_filter_key.
+    """
+    day_end = config.timezone.localize(
+        datetime.combine(day + timedelta(days=1), time.min)
+    )
+    return (
+        Snapshot.objects.filter(
+            event=event, filter_key=get_filter_key(config), created__lt=day_end
+        )
+        .order_by("-created", "-pk")
+        .first()
+    )
+
+
+def get_previous_snapshot(snapshot):
+    """Return the snapshot before the given one that counts the same positions."""
+    return (
+        Snapshot.objects.filter(
+            event_id=snapshot.event_id,
+            filter_key=snapshot.filter_key,
+            pk__lt=snapshot.pk,
+        )
+        .order_by("-pk")
+        .first()
+    )
+
+
+def get_snapshot_daily_totals(snapshot):
+    """Return the (date, count, cents) buckets stored in a snapshot."""
+    if not snapshot.start:
+        return []
+    counts = unpack_values(bytes(snapshot.counts))
+    totals = unpack_values(bytes(snapshot.totals))
+    days = (snapshot.start + timedelta(days=offset) for offset in range(len(counts)))
+    return list(zip(days, counts, totals))
+
+
+def build_snapshot_chart(event, snapshot, config=None):
+    """
+    Build chart data like chart.build_chart_and_text from a snapshot, with the
+    goals and chart settings the event has now. Snapshots only hold daily
+    totals, so hourly charts are shown per day instead of reading the current
+    positions.
+    """
+    config = config or get_config(event)
+    daily_totals = get_snapshot_daily_totals(snapshot)
+    if (
+        daily_totals
+        and get_resolution(config, daily_totals[0][0], daily_totals[-1][0]) == "hour"
+    ):
+        config = replace(config, resolution="day")
+    chart_data = build_chart_and_text(
+        event,
+        config,
+        {"count": snapshot.count, "total": snapshot.total},
+        daily_totals,
+    )
+    chart_data["last_generated"] = snapshot.created
+    return chart_data
+
+
+def diff_snapshots(old, new, places=2):
+    """
+    Return the days on which two snapshots differ, as dicts of the count and
+    total of either snapshot, totals as Decimals. Days missing from a snapshot
+    count as zero. Snapshots that count different positions, e.g. after the
+    item filter has been changed, are not compared, and None is returned.
+    """
+    if old.filter_key != new.filter_key:
+        return None
+    old_totals, new_totals = (
+        {day: (count, total) for day, count, total in get_snapshot_daily_totals(s)}
+        for s in (old, new)
+    )
+    rows = []
+    for day in sorted(set(old_totals) | set(new_totals)):
+        old_count, old_total = old_totals.get(day, (0, 0))
+        new_count, new_total = new_totals.get(day, (0, 0))
+        if (old_count, old_total) == (new_count, new_total):
+            continue
+        rows.append(
+            {
+                "date": day,
+                "old_count": old_count,
+                "new_count": new_count,
+                "old_total": from_cents(old_total, places),
+                "new_total": from_cents(new_total, places),
+                "count_change": new_count - old_count,
+                "total_change": from_cents(new_total - old_total, places),
+            }
+        )
+    return rows
@@ -0,0 +1,152 @@
+"""
+Server-side rendering of the charts as SVG, as an alternative to drawing them
+with Morris.js in the browser. The charts are rendered once whenever the data
+is generated and cached with it, so pages showing them need no JavaScript.
+Only presentation attributes are used, which keeps them compatible with a
+strict content security policy.
+"""
+import math
+from datetime import datetime
+
+from .payload import format_bucket
+
+WIDTH = 800
+HEIGHT = 300
+PADDING = (10, 10, 30, 70)  # top, right, bottom, left
+TICKS = 5
+X_LABELS = 5
+LINE_COLOR = "#0b62a4"
+FORECAST_COLOR = "#7a92a3"
+BAND_COLOR = "#c7d1d9"
+GOAL_COLOR = "#33c33c"
+GRID_COLOR = "#aaaaaa"
+TEXT_COLOR = "#888888"
+
+
+def get_x(bucket):
+    """Position of a day or an hour on the time axis, in days."""
+    if isinstance(bucket, datetime):
+        return bucket.toordinal() + bucket.hour / 24
+    return bucket.toordinal()
+
+
+def get_ticks(low, high, count=TICKS):
+    """Return round, evenly spaced values from at most low to at least high."""
+    if high <= low:
+        high = low + 1
+    raw_step = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(
+        factor * magnitude
+        for factor in (1, 2, 2.5, 5, 10)
+        if factor * magnitude >= raw_step
+    )
+    start = math.floor(low / step) * step
+    count = math.ceil((high - start) / step)
+    return [start + index * step for index in range(count + 1)]
+
+
+def get_path(points):
+    return " ".join("{:.1f},{:.1f}".format(x, y) for x, y in points)
+
+
+def render_chart(points, targets=(), forecast=()):
+    """
+    Render a chart like the one drawn by chart.html: the (bucket, value) points
+    as an area, the targets as goal lines and the (day, forecast, lower, upper)
+    rows of a forecast as a line with its confidence band.
+    """
+    if not points:
+        return ""
+    top, right, bottom, left = PADDING
+    plot_width = WIDTH - left - right
+    plot_height = HEIGHT - top - bottom
+    values = [float(value) for bucket, value in points]
+    ticks = get_ticks(
+        min(values),
+        max(
+            values
+            + [float(target) for target in targets if target]
+            + [float(row[3]) for row in forecast]
+        ),
+    )
+    low, high = ticks[0], ticks[-1]
+    positions = [get_x(bucket) for bucket, value in points] + [
+        get_x(row[0]) for row in forecast
+    ]
+    x_min, x_max = min(positions), max(positions)
+    x_range = (x_max - x_min) or 1
+
+    def scale(x, y):
+        return (
+            left + (get_x(x) - x_min) / x_range * plot_width,
+            top + (high - float(y)) / (high - low) * plot_height,
+        )
+
+    parts = [
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {} {}" width="100%" '
+        'role="img" font-family="sans-serif" font-size="12" fill="{}">'.format(
+            WIDTH, HEIGHT, TEXT_COLOR
+        )
+    ]
+    for tick in ticks:
+        y = scale(points[0][0], tick)[1]
+        parts.append(
+            '<line x1="{}" x2="{}" y1="{:.1f}" y2="{:.1f}" stroke="{}" '
+            'stroke-width="0.5"/>'.format(left, WIDTH - right, y, y, GRID_COLOR)
+        )
+        parts.append(
+            '<text x="{}" y="{:.1f}" text-anchor="end">{:.2f}</text>'.format(
+                left - 5, y + 4, tick
+            )
+        )
+    buckets = [bucket for bucket, value in points] + [row[0] for row in forecast[1:]]
+    step = (len(buckets) - 1) / (X_LABELS - 1)
+    labelled = sorted({round(index * step) for index in range(X_LABELS)})
+    for index in labelled:
+        bucket = buckets[index]
+        parts.append(
+            '<text x="{:.1f}" y="{}" text-anchor="middle">{}</text>'.format(
+                scale(bucket, low)[0], HEIGHT - 10, format_bucket(bucket)
+            )
+        )
+    if forecast:
+        parts.append(
+            '<polygon points="{}" fill="{}" fill-opacity="0.5"/>'.format(
+                get_path(
+                    [scale(row[0], row[3]) for row in forecast]
+                    + [scale(row[0], row[2]) for row in reversed(forecast)]
+                ),
+                BAND_COLOR,
+            )
+        )
+        parts.append(
+            '<polyline points="{}" fill="none" stroke="{}" stroke-width="2" '
+            'stroke-dasharray="6,4"/>'.format(
+                get_path([scale(row[0], row[1]) for row in forecast]), FORECAST_COLOR
+            )
+        )
+    line = [scale(bucket, value) for bucket, value in points]
+    baseline = scale(points[0][0], low)[1]
+    parts.append(
+        '<polygon points="{}" fill="{}" fill-opacity="0.3"/>'.format(
+            get_path(
+                [(line[0][0], baseline)] + line + [(line[-1][0], baseline)]
+            ),
+            LINE_COLOR,
+        )
+    )
+    parts.append(
+        '<polyline points="{}" fill="none" stroke="{}" stroke-width="2"/>'.format(
+            get_path(line), LINE_COLOR
+        )
+    )
+    for target in targets:
+        if target and low <= float(target) <= high:
+            y = scale(points[0][0], target)[1]
+            parts.append(
+                '<line x1="{}" x2="{}" y1="{:.1f}" y2="{:.1f}" stroke="{}" '
+                'stroke-width="4"/>'.format(left, WIDTH - right, y, y, GOAL_COLOR)
+            )
+    parts.append("</svg>")
+    return "".join(parts)
@@ -0,0 +1,40 @@
+from django.core.cache import caches
+from pretix.base.services.tasks import EventTask, OrganizerTask
+from pretix.celery_app import app
+
+from .batch import get_stretchgoals_events, refresh_events
+from .campaigns import get_campaign, refresh_campaign
+from .chart import refresh_chart_and_text
+from .utils import (
+    get_campaign_queued_key, get_organizer_queued_key, get_queued_key,
+)
+
+
+@app.task(base=EventTask)
+def refresh_chart_data(event, public=False, force=False):
+    try:
+        refresh_chart_and_text(event, public=public, force=force)
+    finally:
+        caches["default"].delete(get_queued_key(event, public))
+
+
+@app.task(base=OrganizerTask)
+def refresh_organizer_chart_data(organizer, event_ids=None):
+    try:
+        events = get_stretchgoals_events(organizer)
+        if event_ids is not None:
+            events = events.filter(pk__in=event_ids)
+        refresh_events(events)
+    finally:
+        caches["default"].delete(get_organizer_queued_key(organizer))
+
+
+@app.task(base=OrganizerTask)
+def refresh_campaign_chart_data(organizer, campaign_id, force=False):
+    campaign = get_campaign(organizer, campaign_id)
+    if campaign is None:
+        return
+    try:
+        refresh_campaign(organizer, campaign, force=force)
+    finally:
+        caches["default"].delete(get_campaign_queued_key(organizer, campaign))
@@ -1,18 +1,69 @@
 from django.urls import re_path
 
-from .views import ControlView, PublicView, SettingsView
+from .views import (
+    AsyncPublicDataView, AsyncWidgetView, CampaignSettingsView, CampaignView,
+    ControlDataView, ControlView, OrganizerView, PublicDataView, PublicView,
+    SettingsView, SnapshotView, WidgetView,
+)
 
 urlpatterns = [
+    re_path(
+        r"^control/organizer/(?P<organizer>[^/]+)/stretchgoals/$",
+        OrganizerView.as_view(),
+        name="organizer",
+    ),
+    re_path(
+        r"^control/organizer/(?P<organizer>[^/]+)/stretchgoals/campaigns/add/$",
+        CampaignSettingsView.as_view(),
+        name="campaign.add",
+    ),
+    re_path(
+        r"^control/organizer/(?P<organizer>[^/]+)/stretchgoals/campaigns/(?P<campaign>\d+)/$",
+        CampaignView.as_view(),
+        name="campaign",
+    ),
+    re_path(
+        r"^control/organizer/(?P<organizer>[^/]+)/stretchgoals/campaigns/(?P<campaign>\d+)/settings/$",
+        CampaignSettingsView.as_view(),
+        name="campaign.settings",
+    ),
     re_path(
         r"^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/settings/stretchgoals/",
         SettingsView.as_view(),
         name="settings",
     ),
+    re_path(
+        r"^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/stretchgoals/data.json$",
+        ControlDataView.as_view(),
+        name="control.data",
+    ),
+    re_path(
+        r"^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/stretchgoals/snapshots/$",
+        SnapshotView.as_view(),
+        name="snapshots",
+    ),
     re_path(
         r"^control/event/(?P<organizer>[^/]+)/(?P<event>[^/]+)/stretchgoals/",
         ControlView.as_view(),
         name="control",
     ),
+    # Async variants of the public endpoints for ASGI deployments. pretix routes
+    # event_patterns through synchronous event handling, so these are only
+    # available on the main domain.
+    re_path(
+        r"^(?P<organizer>[^/]+)/(?P<event>[^/]+)/stats/async/data.json$",
+        AsyncPublicDataView.as_view(),
+        name="public.data.async",
+    ),
+    re_path(
+        r"^(?P<organizer>[^/]+)/(?P<event>[^/]+)/stats/async/widget.svg$",
+        AsyncWidgetView.as_view(),
+        name="widget.async",
+    ),
 ]
 
-event_patterns = [re_path(r"^stats/", PublicView.as_view(), name="public")]
+event_patterns = [
+    re_path(r"^stats/data.json$", PublicDataView.as_view(), name="public.data"),
+    re_path(r"^stats/widget.svg$", WidgetView.as_view(), name="widget"),
+    re_path(r"^stats/", PublicView.as_view(), name="public"),
+]
@@ -1,27 +1,154 @@
+import hashlib
 import json
 from i18nfield.strings import LazyI18nString
 from i18nfield.utils import I18nJSONEncoder
 
 
-def get_goals(event):
-    goals = json.loads(event.settings.get("stretchgoals_goals") or "[]")
+def load_goals(goals):
     for goal in goals:
         goal["name"] = LazyI18nString(goal["name"])
         goal["description"] = LazyI18nString(goal["description"])
     return goals
 
 
-def set_goals(event, goals):
+def prepare_goals(goals):
+    """Sort the goals by their total, and add the average price they require."""
     goals = sorted(goals, key=lambda x: x["total"])
     for goal in goals:
         if goal["amount"] and goal["total"]:
             goal["avg"] = round(goal["total"] / goal["amount"], 2)
-    event.settings.set("stretchgoals_goals", json.dumps(goals, cls=I18nJSONEncoder))
+    return goals
+
+
+def get_goals(event):
+    return load_goals(json.loads(event.settings.get("stretchgoals_goals") or "[]"))
+
+
+def set_goals(event, goals):
+    event.settings.set(
+        "stretchgoals_goals", json.dumps(prepare_goals(goals), cls=I18nJSONEncoder)
+    )
+
+
+def get_campaigns(organizer):
+    """
+    Return the campaigns of an organizer. A campaign combines the revenue of
+    several events towards shared goals, and consists of an id, a name, the
+    ids of its events and its goals.
+    """
+    campaigns = json.loads(organizer.settings.get("stretchgoals_campaigns") or "[]")
+    for campaign in campaigns:
+        campaign["name"] = LazyI18nString(campaign["name"])
+        campaign["goals"] = load_goals(campaign["goals"])
+    return campaigns
+
+
+def set_campaigns(organizer, campaigns):
+    for campaign in campaigns:
+        campaign["goals"] = prepare_goals(campaign["goals"])
+    organizer.settings.set(
+        "stretchgoals_campaigns", json.dumps(campaigns, cls=I18nJSONEncoder)
+    )
+
+
+# Increase whenever the format of the cached chart data changes
+CACHE_SCHEMA_VERSION = 3
+# All settings the chart data depends on
+CACHE_SETTINGS = (
+    "locales",
+    "timezone",
+    "stretchgoals_breakdown",
+    "stretchgoals_chart_averages",
+    "stretchgoals_chart_totals",
+    "stretchgoals_end_date",
+    "stretchgoals_forecast",
+    "stretchgoals_goals",
+    "stretchgoals_include_pending",
+    "stretchgoals_items",
+    "stretchgoals_min_orders",
+    "stretchgoals_public_text",
+    "stretchgoals_resolution",
+    "stretchgoals_start_date",
+    "stretchgoals_static_charts",
+)
+
+
+def get_cache_version(event):
+    """
+    Hash everything the chart data depends on apart from the orders, so that
+    data computed for other settings (or an older plugin version) is never
+    served, without having to invalidate it explicitly.
+    """
+    values = [
+        CACHE_SCHEMA_VERSION,
+        event.organizer_id,
+        event.pk,
+        event.date_from.isoformat(),
+    ] + [event.settings.get(key, as_type=str) for key in CACHE_SETTINGS]
+    return hashlib.sha1(json.dumps(values).encode()).hexdigest()[:16]
+
+
+def get_cache_variant(public):
+    """The public chart ends yesterday, the backend chart includes today."""
+    return "public" if public else "control"
+
+
+def get_cache_key(event, public=False):
+    return "stretchgoals_data_{}_{}".format(
+        get_cache_variant(public), get_cache_version(event)
+    )
+
+
+def get_fresh_cache_key(event, public=False):
+    return "stretchgoals_fresh_{}_{}".format(
+        get_cache_variant(public), get_cache_version(event)
+    )
+
+
+def get_lock_key(event, public=False):
+    return "stretchgoals_lock_{}_{}".format(event.pk, get_cache_variant(public))
+
+
+def get_queued_key(event, public=False):
+    return "stretchgoals_queued_{}_{}".format(event.pk, get_cache_variant(public))
+
+
+def get_organizer_queued_key(organizer, public=False):
+    return "stretchgoals_queued_organizer_{}_{}".format(
+        organizer.pk, get_cache_variant(public)
+    )
+
+
+def get_campaign_cache_key(campaign, version):
+    return "stretchgoals_campaign_data_{}_{}".format(campaign["id"], version)
+
+
+def get_campaign_fresh_key(campaign):
+    return "stretchgoals_campaign_fresh_{}".format(campaign["id"])
+
+
+def get_campaign_lock_key(organizer, campaign):
+    return "stretchgoals_campaign_lock_{}_{}".format(organizer.pk, campaign["id"])
 
 
-def get_cache_key(event):
-    return "stretchgoals_data_{}".format(event.slug)
+def get_campaign_queued_key(organizer, campaign):
+    return "stretchgoals_campaign_queued_{}_{}".format(organizer.pk, campaign["id"])
 
 
 def invalidate_cache(event):
-    event.cache.delete(get_cache_key(event))
+    """
+    Mark the cached data as outdated, including the data of the campaigns the
+    event is part of. It is still served until it is replaced.
+    """
+    event.cache.delete_many(
+        [get_fresh_cache_key(event, public) for public in (False, True)]
+    )
+    campaigns = [
+        campaign
+        for campaign in get_campaigns(event.organizer)
+        if event.pk in campaign["events"]
+    ]
+    if campaigns:
+        event.organizer.cache.delete_many(
+            [get_campaign_fresh_key(campaign) for campaign in campaigns]
+        )
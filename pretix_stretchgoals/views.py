@@ -1,33 +1,130 @@
-from django.http import Http404
+import json
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import redirect
+from django.template.loader import render_to_string
 from django.urls import reverse
-from django.views.generic import TemplateView
-from i18nfield.strings import LazyI18nString
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, quote_etag,
+)
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date
+from django.utils.translation import get_language, gettext_lazy as _
+from django.views import View
+from django.views.generic import FormView, TemplateView
+from django_scopes import scope, scopes_disabled
+from pretix.base.models import Event
 from pretix.control.views.event import EventSettingsFormView
+from pretix.multidomain.urlreverse import build_absolute_uri
 
-from .chart import get_chart_and_text
-from .forms import StretchgoalsSettingsForm
-from .utils import get_goals, invalidate_cache, set_goals
+from .batch import (
+    get_cached_chart_data, get_organizer_events, schedule_organizer_refresh,
+)
+from .campaigns import (
+    get_campaign, get_campaign_config, get_campaign_data, get_campaign_events,
+    schedule_campaign_refresh,
+)
+from .chart import (
+    STALE_TIMEOUT, aget_chart_and_text, compute_chart_and_text, get_cache_keys,
+    get_chart_and_text, render_chart_data, schedule_refresh,
+)
+from .config import get_config, get_currency_places
+from .forms import CampaignForm, StretchgoalsSettingsForm
+from .json import ChartJSONEncoder
+from .payload import from_cents
+from .profiling import Profile
+from .snapshots import (
+    build_snapshot_chart, diff_snapshots, get_previous_snapshot, get_snapshot,
+    get_snapshot_as_of, get_snapshots,
+)
+from .utils import (
+    get_campaign_fresh_key, get_campaigns, get_goals, invalidate_cache,
+    set_campaigns, set_goals,
+)
+
+WIDGET_WIDTH = 320
+
+
+def get_next_goal(chart_data):
+    if not chart_data:
+        return None
+    return next(
+        (goal for goal in chart_data["goals"] if goal["total_left"] > 0), None
+    )
+
+
+def get_visible_campaign_events(request, campaign, visible_events=None):
+    """
+    Return the events of a campaign, or None if the user may not see all of them,
+    as the campaign figures include the revenue of each.
+    """
+    events = get_campaign_events(request.organizer, campaign)
+    if visible_events is None:
+        visible_events = get_organizer_events(request)
+    visible = {event.pk for event in visible_events}
+    if not events or any(event.pk not in visible for event in events):
+        return None
+    return events
+
+
+def render_campaign_data(campaign, events, chart_data, series=True):
+    """Like chart.render_chart_data, with the goals of the campaign."""
+    last_event = events[-1]
+    return render_chart_data(
+        last_event,
+        chart_data,
+        series=series,
+        config=get_campaign_config(campaign, get_config(last_event)),
+    )
+
+
+def get_breakdown_json(series):
+    """The breakdown rows are serialised JSON already and inserted as they are."""
+    meta = json.dumps({"keys": series["keys"], "labels": series["labels"]})
+    return '{}, "data": {}}}'.format(meta[:-1], series["data"])
 
 
 class ChartMixin:
+    profile = None
+    public = False
+    with_breakdown = False
+
     def get(self, request, *args, **kwargs):
         resp = super().get(request, *args, **kwargs)
-        resp["Content-Security-Policy"] = (
-            "script-src 'unsafe-eval' 'unsafe-inline'; style-src 'unsafe-inline'"
-        )
+        if (
+            not request.event.settings.stretchgoals_static_charts
+            or resp.context_data.get("breakdown")
+        ):
+            # Morris.js needs eval and inline scripts, server-side charts do not.
+            # The breakdown charts are always drawn with Morris.js.
+            resp["Content-Security-Policy"] = (
+                "script-src 'unsafe-eval' 'unsafe-inline'; style-src 'unsafe-inline'"
+            )
         return resp
 
+    def get_chart_data(self):
+        return get_chart_and_text(
+            self.request.event, public=self.public, profile=self.profile
+        )
+
     def get_context_data(self, *args, **kwargs):
         ctx = super().get_context_data()
-        ctx.update(get_chart_and_text(self.request.event))
-        ctx["public_text"] = LazyI18nString(data=ctx["public_text"])
-
+        chart_data = self.get_chart_data()
+        if chart_data is None:
+            ctx["generating"] = True
+            return ctx
+        ctx.update(
+            render_chart_data(
+                self.request.event, chart_data, breakdown=self.with_breakdown
+            )
+        )
         return ctx
 
 
 class ControlView(ChartMixin, TemplateView):
     template_name = "pretixplugins/stretchgoals/control.html"
+    with_breakdown = True
 
     def dispatch(self, request, *args, **kwargs):
         if not request.user.has_event_permission(
@@ -36,17 +133,571 @@ class ControlView(ChartMixin, TemplateView):
             raise Http404()
         if "refresh" in request.GET:
             invalidate_cache(request.event)
+            schedule_refresh(request.event, force=True)
+            messages.success(
+                request, _("The statistics will be regenerated in the background.")
+            )
+            return redirect(
+                reverse(
+                    "plugins:pretix_stretchgoals:control",
+                    kwargs={
+                        "organizer": request.event.organizer.slug,
+                        "event": request.event.slug,
+                    },
+                )
+            )
+        self.snapshot = None
+        if "snapshot" in request.GET:
+            self.snapshot = get_snapshot(request.event, request.GET["snapshot"])
+            if self.snapshot is None:
+                raise Http404()
+        elif "as_of" in request.GET:
+            try:
+                day = parse_date(request.GET["as_of"])
+            except ValueError:  # well formatted, but not a valid date
+                day = None
+            if day:
+                self.snapshot = get_snapshot_as_of(
+                    request.event, day, get_config(request.event)
+                )
+            if self.snapshot is None:
+                messages.error(
+                    request,
+                    _(
+                        "There is no stored snapshot with the current settings "
+                        "for the given date."
+                    ),
+                )
+                return redirect(get_snapshots_url(request.event))
+        if "debug" in request.GET and request.user.has_event_permission(
+            request.organizer, request.event, "can_change_event_settings"
+        ):
+            self.profile = Profile()
         return super().dispatch(request, *args, **kwargs)
 
+    def get_chart_data(self):
+        if self.snapshot:
+            return build_snapshot_chart(self.request.event, self.snapshot)
+        return super().get_chart_data()
+
+    def get_context_data(self, *args, **kwargs):
+        ctx = super().get_context_data(*args, **kwargs)
+        ctx["snapshot"] = self.snapshot
+        if self.profile:
+            # Measure a full computation, regardless of the cache state, without
+            # adding to the rollup table and the snapshot history
+            compute_chart_and_text(
+                self.request.event, profile=self.profile, store=False
+            )
+            ctx["profile"] = self.profile
+        if ctx.get("breakdown"):
+            ctx["breakdown"] = [
+                (kind, get_breakdown_json(series))
+                for kind, series in ctx["breakdown"].items()
+            ]
+        return ctx
+
+
+def get_snapshots_url(event):
+    return reverse(
+        "plugins:pretix_stretchgoals:snapshots",
+        kwargs={"organizer": event.organizer.slug, "event": event.slug},
+    )
+
+
+class SnapshotView(TemplateView):
+    """
+    The snapshot history of an event, and the days on which a snapshot differs
+    from an earlier one – by default the one before it.
+    """
+
+    template_name = "pretixplugins/stretchgoals/snapshots.html"
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.has_event_permission(
+            request.organizer, request.event, "can_view_orders"
+        ):
+            raise Http404()
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, *args, **kwargs):
+        ctx = super().get_context_data()
+        event = self.request.event
+        places = get_currency_places(event)
+        ctx["snapshots"] = [
+            {"snapshot": snapshot, "total": from_cents(snapshot.total, places)}
+            for snapshot in get_snapshots(event)
+        ]
+        if "diff" in self.request.GET:
+            new = get_snapshot(event, self.request.GET["diff"])
+            if new is None:
+                raise Http404()
+            if "base" in self.request.GET:
+                old = get_snapshot(event, self.request.GET["base"])
+                if old is None:
+                    raise Http404()
+            else:
+                old = get_previous_snapshot(new)
+            ctx["diff_new"] = new
+            ctx["diff_old"] = old
+            ctx["diff"] = diff_snapshots(old, new, places) if old else None
+        return ctx
+
 
 class PublicView(ChartMixin, TemplateView):
     template_name = "pretixplugins/stretchgoals/public.html"
+    public = True
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.event.settings.stretchgoals_is_public:
+            raise Http404()
+        return super().dispatch(request, *args, **kwargs)
+
+
+class OrganizerView(TemplateView):
+    template_name = "pretixplugins/stretchgoals/organizer.html"
+
+    def dispatch(self, request, *args, **kwargs):
+        self.events = list(get_organizer_events(request).order_by("-date_from"))
+        if not self.events:
+            raise Http404()
+        if "refresh" in request.GET:
+            for event in self.events:
+                invalidate_cache(event)
+            schedule_organizer_refresh(request.organizer)
+            messages.success(
+                request, _("The statistics will be regenerated in the background.")
+            )
+            return redirect(
+                reverse(
+                    "plugins:pretix_stretchgoals:organizer",
+                    kwargs={"organizer": request.organizer.slug},
+                )
+            )
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, *args, **kwargs):
+        ctx = super().get_context_data()
+        chart_data, outdated = get_cached_chart_data(self.events)
+        if outdated and schedule_organizer_refresh(self.request.organizer, outdated):
+            # Without a celery worker, the task has been run eagerly
+            chart_data = {
+                event: data or chart_data[event]
+                for event, data in get_cached_chart_data(self.events)[0].items()
+            }
+        chart_data = {
+            event: render_chart_data(event, data, series=False) if data else None
+            for event, data in chart_data.items()
+        }
+        ctx["events"] = [
+            {
+                "event": event,
+                "data": chart_data[event],
+                "next_goal": get_next_goal(chart_data[event]),
+            }
+            for event in self.events
+        ]
+        ctx["campaigns"] = []
+        for campaign in get_campaigns(self.request.organizer):
+            events = get_visible_campaign_events(self.request, campaign, self.events)
+            if events is None:
+                continue
+            data = get_campaign_data(self.request.organizer, campaign, events)
+            data = (
+                render_campaign_data(campaign, events, data, series=False)
+                if data
+                else None
+            )
+            ctx["campaigns"].append(
+                {
+                    "campaign": campaign,
+                    "events": events,
+                    "currency": events[-1].currency,
+                    "data": data,
+                    "next_goal": get_next_goal(data),
+                }
+            )
+        ctx["can_change_campaigns"] = self.request.user.has_organizer_permission(
+            self.request.organizer, "can_change_organizer_settings", self.request
+        )
+        return ctx
+
+
+class CampaignView(TemplateView):
+    template_name = "pretixplugins/stretchgoals/campaign.html"
+
+    def dispatch(self, request, *args, **kwargs):
+        self.campaign = get_campaign(request.organizer, int(kwargs["campaign"]))
+        if self.campaign is None:
+            raise Http404()
+        self.events = get_visible_campaign_events(request, self.campaign)
+        if self.events is None:
+            raise Http404()
+        if "refresh" in request.GET:
+            request.organizer.cache.delete(get_campaign_fresh_key(self.campaign))
+            schedule_campaign_refresh(request.organizer, self.campaign, force=True)
+            messages.success(
+                request, _("The statistics will be regenerated in the background.")
+            )
+            return redirect(
+                reverse(
+                    "plugins:pretix_stretchgoals:campaign",
+                    kwargs={
+                        "organizer": request.organizer.slug,
+                        "campaign": self.campaign["id"],
+                    },
+                )
+            )
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        resp = super().get(request, *args, **kwargs)
+        # Campaign charts are always drawn with Morris.js, see ChartMixin
+        resp["Content-Security-Policy"] = (
+            "script-src 'unsafe-eval' 'unsafe-inline'; style-src 'unsafe-inline'"
+        )
+        return resp
+
+    def get_context_data(self, *args, **kwargs):
+        ctx = super().get_context_data()
+        ctx["campaign"] = self.campaign
+        ctx["events"] = self.events
+        ctx["currency"] = self.events[-1].currency
+        ctx["can_change_campaigns"] = self.request.user.has_organizer_permission(
+            self.request.organizer, "can_change_organizer_settings", self.request
+        )
+        chart_data = get_campaign_data(
+            self.request.organizer, self.campaign, self.events
+        )
+        if chart_data is None:
+            ctx["generating"] = True
+            return ctx
+        ctx.update(render_campaign_data(self.campaign, self.events, chart_data))
+        return ctx
+
+
+class CampaignSettingsView(FormView):
+    form_class = CampaignForm
+    template_name = "pretixplugins/stretchgoals/campaign_settings.html"
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.has_organizer_permission(
+            request.organizer, "can_change_organizer_settings", request
+        ):
+            raise Http404()
+        self.campaign = None
+        if "campaign" in kwargs:
+            self.campaign = get_campaign(request.organizer, int(kwargs["campaign"]))
+            if self.campaign is None:
+                raise Http404()
+            if "delete" in request.GET:
+                campaigns = get_campaigns(request.organizer)
+                for campaign in campaigns:
+                    if campaign["id"] == self.campaign["id"]:
+                        campaign["goals"].pop(int(request.GET.get("delete", 1)) - 1)
+                set_campaigns(request.organizer, campaigns)
+                return redirect(self.get_success_url())
+        return super().dispatch(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        if self.campaign and "delete_campaign" in request.POST:
+            set_campaigns(
+                request.organizer,
+                [
+                    campaign
+                    for campaign in get_campaigns(request.organizer)
+                    if campaign["id"] != self.campaign["id"]
+                ],
+            )
+            messages.success(request, _("The campaign has been deleted."))
+            return redirect(
+                reverse(
+                    "plugins:pretix_stretchgoals:organizer",
+                    kwargs={"organizer": request.organizer.slug},
+                )
+            )
+        return super().post(request, *args, **kwargs)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["organizer"] = self.request.organizer
+        kwargs["campaign"] = self.campaign
+        return kwargs
+
+    def form_valid(self, form):
+        self.campaign = form.save()
+        messages.success(self.request, _("Your changes have been saved."))
+        return super().form_valid(form)
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["campaign"] = self.campaign
+        return ctx
+
+    def get_success_url(self, **kwargs):
+        return reverse(
+            "plugins:pretix_stretchgoals:campaign.settings",
+            kwargs={
+                "organizer": self.request.organizer.slug,
+                "campaign": self.campaign["id"],
+            },
+        )
+
+
+class ChartDataMixin:
+    public = False
+    max_age = 0
+    content_type = "application/json"
+    with_series = True
+    with_breakdown = False
+
+    def get(self, request, *args, **kwargs):
+        return self.get_response(
+            get_chart_and_text(request.event, public=self.public)
+        )
+
+    def get_response(self, chart_data):
+        request = self.request
+        if chart_data is None:
+            return self.get_generating_response()
+
+        # Which goals are shown depends on a setting outside of the chart data
+        etag = quote_etag(
+            "{}-{}-{}-{}".format(
+                request.event.pk,
+                int(chart_data["last_generated"].timestamp() * 1000),
+                get_language(),
+                int(bool(request.event.settings.stretchgoals_calculation_text)),
+            )
+        )
+        last_modified = int(chart_data["last_generated"].timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = HttpResponse(
+                self.get_content(
+                    render_chart_data(
+                        request.event,
+                        chart_data,
+                        series=self.with_series,
+                        breakdown=self.with_breakdown,
+                    )
+                ),
+                content_type=self.content_type,
+            )
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, **self.get_cache_control())
+        return response
+
+    def get_generating_response(self):
+        return JsonResponse({"generating": True}, status=202)
+
+    def get_cache_control(self):
+        if self.public:
+            return {"public": True, "max_age": self.max_age}
+        return {"private": True, "no_cache": True}
+
+    def get_content(self, chart_data):
+        """
+        The chart series are rendered as serialised JSON already, so they are
+        inserted into the response as they are.
+        """
+        settings = self.request.event.settings
+        show_details = chart_data["significant"] or not self.public
+        show_goals = show_details and (
+            settings.stretchgoals_calculation_text or not self.public
+        )
+        payload = {
+            "last_generated": chart_data["last_generated"],
+            "significant": chart_data["significant"],
+            "avg_now": chart_data["avg_now"] if show_details else None,
+            "total_now": chart_data["total_now"] if show_details else None,
+            "public_text": chart_data["public_text"] if show_details else None,
+            "forecast": chart_data["forecast"] if show_details else None,
+            "goals": [
+                {
+                    "name": str(goal["name"]),
+                    "description": str(goal["description"]),
+                    "total": goal["total"],
+                    "amount": goal["amount"],
+                    "avg": goal.get("avg"),
+                    "avg_required": goal["avg_required"],
+                    "total_left": goal["total_left"],
+                    "projected_date": goal["projected_date"],
+                }
+                for goal in chart_data["goals"]
+            ]
+            if show_goals
+            else [],
+        }
+        content = json.dumps(
+            payload,
+            cls=ChartJSONEncoder,
+            places=get_currency_places(self.request.event),
+        )
+        if chart_data.get("breakdown"):
+            content = '{}, "breakdown": {{{}}}}}'.format(
+                content[:-1],
+                ",".join(
+                    '"{}":{}'.format(kind, get_breakdown_json(series))
+                    for kind, series in chart_data["breakdown"].items()
+                ),
+            )
+        series = ",".join(
+            '"{}":{}'.format(key, value if show_details else "null")
+            for key, value in chart_data["data"].items()
+        )
+        return '{}, "data": {{{}}}}}'.format(content[:-1], series)
+
+
+class ControlDataView(ChartDataMixin, View):
+    with_breakdown = True
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.has_event_permission(
+            request.organizer, request.event, "can_view_orders"
+        ):
+            raise Http404()
+        return super().dispatch(request, *args, **kwargs)
+
+
+class PublicDataView(ChartDataMixin, View):
+    public = True
+    max_age = 60
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.event.settings.stretchgoals_is_public:
+            raise Http404()
+        return super().dispatch(request, *args, **kwargs)
+
+
+class WidgetView(ChartDataMixin, View):
+    """
+    A progress bar towards the next goal as an SVG image, for embedding on other
+    websites. It is rendered from the cached data without the page template,
+    and proxies may keep serving it while they revalidate it in the background.
+    """
+
+    public = True
+    max_age = 300
+    content_type = "image/svg+xml"
+    with_series = False
+    template_name = "pretixplugins/stretchgoals/widget.svg"
 
     def dispatch(self, request, *args, **kwargs):
         if not request.event.settings.stretchgoals_is_public:
             raise Http404()
         return super().dispatch(request, *args, **kwargs)
 
+    def get_response(self, chart_data):
+        response = super().get_response(chart_data)
+        response["Content-Security-Policy"] = (
+            "default-src 'none'; style-src 'unsafe-inline'"
+        )
+        return response
+
+    def get_generating_response(self):
+        response = HttpResponse(
+            self.render_widget({"generating": True}),
+            content_type=self.content_type,
+            status=202,
+        )
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def get_cache_control(self):
+        return dict(super().get_cache_control(), stale_while_revalidate=STALE_TIMEOUT)
+
+    def get_content(self, chart_data):
+        goals = chart_data["goals"]
+        if not (
+            chart_data["significant"]
+            and self.request.event.settings.stretchgoals_calculation_text
+        ):
+            goals = []
+        goal = next((goal for goal in goals if goal["total_left"] > 0), None)
+        if goals and not goal:
+            goal = goals[-1]
+        progress = 0
+        if goal and goal["total"]:
+            progress = max(min(chart_data["revenue"] / goal["total"], 1), 0)
+        return self.render_widget(
+            {
+                "significant": chart_data["significant"],
+                "revenue": chart_data["revenue"],
+                "goal": goal,
+                "percent": int(progress * 100),
+                "width": int(progress * WIDGET_WIDTH),
+            }
+        )
+
+    def render_widget(self, context):
+        return render_to_string(
+            self.template_name,
+            dict(context, event=self.request.event, widget_width=WIDGET_WIDTH),
+        )
+
+
+def get_public_event(organizer, event, public=True):
+    """
+    Look up a live event with public goals for the async views, which are not
+    routed through pretix' synchronous event handling. Returns the event and its
+    cache keys, which depend on settings and can thus not be computed in the
+    event loop.
+    """
+    with scopes_disabled():
+        event = (
+            Event.objects.select_related("organizer")
+            .filter(organizer__slug=organizer, slug=event, live=True)
+            .first()
+        )
+    if (
+        event is None
+        or "pretix_stretchgoals" not in event.get_plugins()
+        or not event.settings.stretchgoals_is_public
+    ):
+        raise Http404()
+    return event, get_cache_keys(event, public)
+
+
+class AsyncChartDataMixin:
+    """
+    Async variant of a public ChartDataMixin view, for ASGI deployments. The
+    event lookup, the cache reads and the rendering run in threads. pretix'
+    middleware is synchronous, so Django holds a thread for the request all
+    the same: the view does not save threads, it only avoids blocking the
+    event loop while it waits for the database and the cache.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        # The event is only resolved in get(), see get_public_event
+        return View.dispatch(self, request, *args, **kwargs)
+
+    async def get(self, request, organizer, event):
+        request.event, cache_keys = await sync_to_async(get_public_event)(
+            organizer, event, self.public
+        )
+        request.organizer = request.event.organizer
+        chart_data = await aget_chart_and_text(
+            request.event, cache_keys, public=self.public
+        )
+        return await sync_to_async(self.get_scoped_response)(chart_data)
+
+    def get_scoped_response(self, chart_data):
+        # Outside of pretix' event handling, no scope has been activated
+        with scope(organizer=self.request.organizer):
+            return self.get_response(chart_data)
+
+
+class AsyncPublicDataView(AsyncChartDataMixin, PublicDataView):
+    pass
+
+
+class AsyncWidgetView(AsyncChartDataMixin, WidgetView):
+    pass
+
 
 class SettingsView(EventSettingsFormView):
     form_class = StretchgoalsSettingsForm
@@ -62,6 +713,7 @@ class SettingsView(EventSettingsFormView):
             index = int(request.GET.get("delete", 1)) - 1
             goals.pop(index)
             set_goals(request.event, goals)
+            invalidate_cache(request.event)
             return redirect(self.get_success_url())
         return super().dispatch(request, *args, **kwargs)
 
@@ -70,6 +722,13 @@ class SettingsView(EventSettingsFormView):
         kwargs["event"] = self.request.event
         return kwargs
 
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["widget_url"] = build_absolute_uri(
+            self.request.event, "plugins:pretix_stretchgoals:widget"
+        )
+        return ctx
+
     def get_success_url(self, **kwargs):
         return reverse(
             "plugins:pretix_stretchgoals:settings",
@@ -0,0 +1,73 @@
+import pytest
+from datetime import timedelta
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Organizer
+from pretix_stretchgoals.benchmark import (
+    configure_event, create_synthetic_event,
+)
+
+from .utils import create_orders
+
+
+@pytest.fixture(autouse=True)
+def no_scopes():
+    with scopes_disabled():
+        yield
+
+
+@pytest.fixture
+def organizer(db):
+    return Organizer.objects.create(name="Dummy", slug="dummy")
+
+
+@pytest.fixture
+def event(organizer):
+    event = Event.objects.create(
+        organizer=organizer,
+        name="Dummy",
+        slug="dummy",
+        date_from=now() + timedelta(days=30),
+        plugins="pretix_stretchgoals",
+    )
+    event.settings.timezone = "Europe/Berlin"
+    return event
+
+
+@pytest.fixture
+def items(event):
+    return [
+        event.items.create(name="Ticket", default_price=23),
+        event.items.create(name="Workshop", default_price=42),
+    ]
+
+
+@pytest.fixture
+def orders(event, items):
+    create_orders(event, items)
+
+
+@pytest.fixture
+def locmem_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+
+
+@pytest.fixture
+def make_synthetic_event(db):
+    """
+    Return a factory for synthetic events, see benchmark.create_synthetic_event,
+    configured with goals and both charts.
+    """
+
+    def factory(include_pending=False, filter_items=0, **kwargs):
+        kwargs.setdefault("orders", 300)
+        kwargs.setdefault("days", 20)
+        event = create_synthetic_event(**kwargs)
+        configure_event(
+            event, include_pending=include_pending, filter_items=filter_items
+        )
+        return event
+
+    return factory
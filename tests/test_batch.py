@@ -0,0 +1,45 @@
+"""
+The batch computation has its own bucketing of the positions, so it is
+checked against the chart data computed per event.
+"""
+import pytest
+from datetime import timedelta
+from pretix_stretchgoals.batch import refresh_events
+from pretix_stretchgoals.chart import compute_chart_and_text
+
+from .utils import END, START
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("include_pending", [False, True])
+@pytest.mark.parametrize("filtered", [False, True])
+@pytest.mark.parametrize(
+    "resolution,start,end",
+    [
+        ("day", None, None),
+        ("week", START, END),
+        ("hour", START, END),
+        ("auto", START, START + timedelta(days=2)),
+    ],
+)
+def test_batch_matches_chart_data(
+    event, items, orders, include_pending, filtered, resolution, start, end
+):
+    settings = event.settings
+    settings.stretchgoals_chart_averages = True
+    settings.stretchgoals_chart_totals = True
+    settings.stretchgoals_breakdown = True
+    settings.stretchgoals_forecast = True
+    settings.stretchgoals_include_pending = include_pending
+    settings.stretchgoals_resolution = resolution
+    if start:
+        settings.stretchgoals_start_date = start
+        settings.stretchgoals_end_date = end
+    if filtered:
+        settings.stretchgoals_items = str(items[0].pk)
+
+    expected = compute_chart_and_text(event, store=False)
+    actual = refresh_events([event])[event]
+    expected.pop("last_generated")
+    actual.pop("last_generated")
+    assert actual == expected
@@ -0,0 +1,70 @@
+"""
+Query budgets of the chart generation, on synthetic events. The budgets must
+not depend on the size of the event, so that the charts stay fast for large
+presales. Like the benchmark command, but run as part of the test suite.
+"""
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pretix_stretchgoals.chart import (
+    compute_chart_and_text, get_chart_and_text, refresh_chart_and_text,
+)
+
+MAX_COLD_QUERIES = 25
+MAX_WARM_QUERIES = 20
+MAX_CACHED_QUERIES = 5
+
+
+def count_queries(function, *args, **kwargs):
+    with CaptureQueriesContext(connection) as queries:
+        function(*args, **kwargs)
+    return len(queries.captured_queries)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("include_pending", [False, True])
+@pytest.mark.parametrize("filter_items", [0, 2])
+def test_cold_and_warm_render_query_budget(
+    make_synthetic_event,
+    django_assert_max_num_queries,
+    include_pending,
+    filter_items,
+):
+    event = make_synthetic_event(
+        include_pending=include_pending, filter_items=filter_items
+    )
+    event.settings.flush()
+    with django_assert_max_num_queries(MAX_COLD_QUERIES):
+        compute_chart_and_text(event)
+    event.settings.flush()
+    with django_assert_max_num_queries(MAX_WARM_QUERIES):
+        compute_chart_and_text(event)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("include_pending", [False, True])
+def test_query_count_does_not_grow_with_the_event(
+    make_synthetic_event, include_pending
+):
+    # Same days, so that both use the same chart resolution
+    small = make_synthetic_event(include_pending=include_pending, orders=50)
+    large = make_synthetic_event(include_pending=include_pending, orders=1500, seed=23)
+    counts = {}
+    for name, event in (("small", small), ("large", large)):
+        event.settings.flush()
+        cold = count_queries(compute_chart_and_text, event)
+        event.settings.flush()
+        warm = count_queries(compute_chart_and_text, event)
+        counts[name] = (cold, warm)
+    assert counts["small"] == counts["large"]
+
+
+@pytest.mark.django_db
+def test_cached_render_query_budget(
+    make_synthetic_event, locmem_cache, django_assert_max_num_queries
+):
+    event = make_synthetic_event()
+    refresh_chart_and_text(event, force=True)
+    event.settings.flush()
+    with django_assert_max_num_queries(MAX_CACHED_QUERIES):
+        assert get_chart_and_text(event) is not None
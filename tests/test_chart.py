@@ -0,0 +1,132 @@
+import json
+import pytest
+import pytz
+from datetime import datetime, timedelta
+from django.db.models import Avg, DateTimeField, Max, OuterRef, Subquery, Sum
+from pretix.base.models import OrderPayment, OrderPosition
+from pretix_stretchgoals.chart import (
+    compute_chart_and_text, downsample, get_date_range, get_day, get_day_end,
+    get_day_start, render_chart_data,
+)
+
+from .utils import END, START, TZ, localize
+
+
+@pytest.mark.parametrize(
+    "timestamp,expected",
+    [
+        (get_day_start(START, TZ), START),
+        (get_day_end(START, TZ), START),
+        (get_day_end(START, TZ) + timedelta(seconds=1), START + timedelta(days=1)),
+        (get_day_start(START, TZ) - timedelta(seconds=1), START - timedelta(days=1)),
+        (localize(START, 12), START),
+        # The days are bounded with pytz' LMT offset of +0:53, like they have
+        # always been, so they run from 00:07 to 00:06:59 CET.
+        (localize(START, 0), START - timedelta(days=1)),
+        (localize(START, 0, 7), START),
+        (localize(START, 23, 30), START),
+        (localize(START + timedelta(days=1), 0, 7), START + timedelta(days=1)),
+        (datetime(2024, 3, 4, 11, tzinfo=pytz.utc), START),
+    ],
+)
+def test_get_day(timestamp, expected):
+    assert get_day(timestamp, TZ) == expected
+
+
+def test_get_day_covers_every_window():
+    for day in get_date_range(START, END):
+        assert get_day(get_day_start(day, TZ), TZ) == day
+        assert get_day(get_day_end(day, TZ), TZ) == day
+
+
+def test_downsample_keeps_short_series():
+    assert downsample([1, 2, 3], 10) == [0, 1, 2]
+    assert downsample(list(range(10)), 2) == list(range(10))
+    assert downsample([], 5) == []
+
+
+def test_downsample():
+    values = [index % 7 for index in range(500)]
+    values[250] = 1000
+    sampled = downsample(values, 50)
+    assert len(sampled) == 50
+    assert sampled[0] == 0
+    assert sampled[-1] == len(values) - 1
+    assert sampled == sorted(set(sampled))
+    assert 250 in sampled  # the peak survives
+
+
+def get_legacy_series(event, aggregate, items, include_pending):
+    """The cumulative per-day series as the plugin used to compute them."""
+    op_date = (
+        OrderPayment.objects.filter(
+            order=OuterRef("order"),
+            state__in=(
+                OrderPayment.PAYMENT_STATE_CONFIRMED,
+                OrderPayment.PAYMENT_STATE_REFUNDED,
+            ),
+            payment_date__isnull=False,
+        )
+        .order_by()
+        .values("order")
+        .annotate(m=Max("payment_date"))
+        .values("m")
+    )
+    qs = OrderPosition.objects.filter(
+        order__event=event,
+        order__status__in=["p", "n"] if include_pending else ["p"],
+    ).annotate(payment_date=Subquery(op_date, output_field=DateTimeField()))
+    if items:
+        qs = qs.filter(item__in=items)
+    field = "order__datetime" if include_pending else "payment_date"
+    start_dt = get_day_start(START, TZ)
+    series = []
+    for day in get_date_range(START, END):
+        value = qs.filter(
+            **{field + "__gte": start_dt, field + "__lte": get_day_end(day, TZ)}
+        ).aggregate(value=aggregate("price"))["value"]
+        series.append(
+            {"date": day.strftime("%Y-%m-%d"), "price": float(round(value or 0, 2))}
+        )
+    return series
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("include_pending", [False, True])
+@pytest.mark.parametrize("filtered", [False, True])
+def test_series_match_legacy_queries(event, items, orders, include_pending, filtered):
+    event.settings.stretchgoals_chart_averages = True
+    event.settings.stretchgoals_chart_totals = True
+    event.settings.stretchgoals_include_pending = include_pending
+    event.settings.stretchgoals_start_date = START
+    event.settings.stretchgoals_end_date = END
+    filter_items = [items[0]] if filtered else []
+    if filtered:
+        event.settings.stretchgoals_items = str(items[0].pk)
+
+    expected = {
+        "avg_data": get_legacy_series(event, Avg, filter_items, include_pending),
+        "total_data": get_legacy_series(event, Sum, filter_items, include_pending),
+    }
+    # Once from the positions, once from the filled rollup table
+    for _ in range(2):
+        event.settings.flush()
+        data = render_chart_data(event, compute_chart_and_text(event))["data"]
+        for key, series in expected.items():
+            assert json.loads(data[key])["data"] == series
+
+
+@pytest.mark.django_db
+def test_breakdown_is_only_computed_for_the_backend(event, items, orders):
+    event.settings.stretchgoals_chart_totals = True
+    event.settings.stretchgoals_breakdown = True
+    event.settings.stretchgoals_start_date = START
+    event.settings.stretchgoals_end_date = END
+
+    data = compute_chart_and_text(event)
+    assert "items" in data["breakdown"]
+    assert "breakdown" not in render_chart_data(event, data)
+    rendered = render_chart_data(event, data, breakdown=True)["breakdown"]
+    assert rendered["items"]["keys"]
+
+    assert compute_chart_and_text(event, public=True)["breakdown"] is None
@@ -0,0 +1,137 @@
+import math
+import pytest
+from datetime import date, timedelta
+from pretix_stretchgoals import forecast
+from pretix_stretchgoals.forecast import (
+    FORECAST_DAYS, MAX_GROWTH, MIN_DAYS, ExponentialModel, LinearModel,
+    LogisticModel, get_best_fit, get_forecast, linear_fit,
+)
+from pretix_stretchgoals.payload import pack_values
+
+
+@pytest.fixture(params=["numpy", "python"])
+def implementation(request, monkeypatch):
+    """Run a test with NumPy, if it is installed, and with the fallback."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(forecast, "numpy", None)
+    return request.param
+
+
+def get_daily_totals(cumulative, start=date(2024, 1, 1)):
+    """Turn a cumulative series into (date, count, cents) buckets."""
+    previous = 0
+    result = []
+    for offset, value in enumerate(cumulative):
+        result.append((start + timedelta(days=offset), 1, round(value - previous)))
+        previous = round(value)
+    return result
+
+
+def test_linear_fit(implementation):
+    intercept, slope = linear_fit([0, 1, 2, 3], [1, 3, 5, 7])
+    assert intercept == pytest.approx(1)
+    assert slope == pytest.approx(2)
+
+
+def test_linear_fit_single_x(implementation):
+    assert linear_fit([2, 2, 2], [1, 2, 3]) == pytest.approx((2, 0))
+
+
+def test_linear_model(implementation):
+    x = list(range(10))
+    model = LinearModel.fit(x, [100 + 50 * value for value in x])
+    assert model.get_sse(x, [100 + 50 * value for value in x]) == pytest.approx(0)
+    assert model.solve(600) == pytest.approx(10)
+    assert LinearModel(100, 0).solve(600) is None
+
+
+def test_exponential_model(implementation):
+    x = list(range(10))
+    y = [10 * math.exp(0.3 * value) for value in x]
+    model = ExponentialModel.fit(x, y)
+    assert model.intercept == pytest.approx(math.log(10))
+    assert model.slope == pytest.approx(0.3)
+    assert model.solve(10 * math.exp(3)) == pytest.approx(10)
+    assert ExponentialModel.fit([0, 1], [0, 0]) is None
+
+
+def test_exponential_model_does_not_overflow(implementation):
+    model = ExponentialModel(0, 100)
+    assert all(math.isfinite(value) for value in model.predict([10, 100, 1000]))
+
+
+def test_logistic_model(implementation):
+    x = list(range(20))
+    y = [1000 / (1 + math.exp(-(0.5 * value - 5))) for value in x]
+    model = LogisticModel.fit(x, y, 1000)
+    assert model.intercept == pytest.approx(-5)
+    assert model.slope == pytest.approx(0.5)
+    assert model.solve(500) == pytest.approx(10)
+    assert model.solve(1000) is None
+
+
+@pytest.mark.parametrize(
+    "curve,name",
+    [
+        (lambda x: 1000 + 500 * x, "linear"),
+        (lambda x: 100 * math.exp(0.2 * x), "exponential"),
+        (lambda x: 10000 / (1 + math.exp(-(0.4 * x - 6))), "logistic"),
+    ],
+)
+def test_best_fit(implementation, curve, name):
+    x = list(range(30))
+    model, sse = get_best_fit(x, [curve(value) for value in x])
+    assert model.name == name
+
+
+def test_forecast_needs_enough_days():
+    assert get_forecast(get_daily_totals(range(MIN_DAYS - 1)), []) is None
+    assert get_forecast(get_daily_totals([0] * MIN_DAYS), []) is None
+
+
+def test_forecast_linear_growth(implementation):
+    daily_totals = get_daily_totals([1000 * (offset + 1) for offset in range(10)])
+    last_day = daily_totals[-1][0]
+    result = get_forecast(daily_totals, [5000, 15000, 10**12])
+    assert result["model"] == "linear"
+    assert result["projected_date"] == last_day + timedelta(days=FORECAST_DAYS)
+    assert len(result["data"]) == FORECAST_DAYS + 1
+    assert result["data"][0]["forecast"] == 10000
+    assert result["projected_total"] == pytest.approx(10000 + 1000 * FORECAST_DAYS)
+    assert all(
+        row["lower"] <= row["forecast"] <= row["upper"] for row in result["data"]
+    )
+    # Met already, five days ahead, out of reach
+    assert result["goal_dates"] == [None, last_day + timedelta(days=5), None]
+
+
+def test_forecast_until_event_date(implementation):
+    daily_totals = get_daily_totals([1000 * (offset + 1) for offset in range(10)])
+    event_date = daily_totals[-1][0] + timedelta(days=12)
+    result = get_forecast(daily_totals, [], event_date=event_date)
+    assert result["projected_date"] == event_date
+    assert result["data"][-1]["date"] == event_date.strftime("%Y-%m-%d")
+
+
+def test_forecast_does_not_shrink(implementation):
+    cumulative = [1000, 3000, 6000, 8000, 9000, 9500, 9700, 9800, 9850, 9860]
+    result = get_forecast(get_daily_totals(cumulative), [])
+    assert all(row["lower"] >= 9860 for row in result["data"])
+
+
+@pytest.mark.parametrize("growth,days", [(1.5, 7), (1.2, 20), (3, 30)])
+def test_forecast_of_steep_growth_is_bounded(implementation, growth, days):
+    daily_totals = get_daily_totals([1000 * growth**offset for offset in range(days)])
+    current = sum(cents for day, count, cents in daily_totals)
+    event_date = daily_totals[-1][0] + timedelta(days=200)
+    result = get_forecast(daily_totals, [current * 5, current * 100], event_date)
+    assert result["projected_date"] == event_date
+    for row in result["data"]:
+        assert current <= row["lower"] <= row["forecast"] <= row["upper"]
+        assert row["upper"] <= current * MAX_GROWTH
+    assert result["goal_dates"][1] is None
+    # The series can be cached
+    for key in ("forecast", "lower", "upper"):
+        pack_values([row[key] for row in result["data"]])
@@ -0,0 +1,100 @@
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from pretix_stretchgoals.payload import (
+    COMPRESSED, RAW, divide, from_cents, iterate_series, pack_series,
+    pack_values, to_cents, unpack_values,
+)
+
+
+@pytest.mark.parametrize(
+    "dividend,divisor,expected",
+    [
+        (10, 2, 5),
+        (10, 3, 3),
+        (11, 3, 4),
+        (5, 2, 2),  # half to even
+        (7, 2, 4),  # half to even
+        (1, 4, 0),
+        (3, 4, 1),
+        (0, 7, 0),
+    ],
+)
+def test_divide(dividend, divisor, expected):
+    assert divide(dividend, divisor) == expected
+
+
+def test_divide_rounds_like_decimals():
+    for dividend in range(0, 1000, 7):
+        for divisor in (1, 2, 3, 8, 40):
+            assert divide(dividend, divisor) == round(
+                Decimal(dividend) / Decimal(divisor)
+            )
+
+
+@pytest.mark.parametrize(
+    "value,places,cents",
+    [(Decimal("12.34"), 2, 1234), (Decimal("12"), 0, 12), (Decimal("1.234"), 3, 1234)],
+)
+def test_cents_round_trip(value, places, cents):
+    assert to_cents(value, places) == cents
+    assert from_cents(cents, places) == value
+
+
+def test_pack_values_round_trip():
+    values = [0, 1, -1, 2**40, 123456]
+    data = pack_values(values)
+    assert data[:1] == RAW
+    assert unpack_values(data) == tuple(values)
+
+
+def test_pack_values_compresses_long_arrays():
+    values = list(range(1000))
+    data = pack_values(values)
+    assert data[:1] == COMPRESSED
+    assert len(data) < 8 * len(values)
+    assert unpack_values(data) == tuple(values)
+
+
+def test_pack_values_empty():
+    assert unpack_values(pack_values([])) == ()
+
+
+def test_pack_series_contiguous_days():
+    start = date(2024, 3, 30)
+    days = [date(2024, 3, 30), date(2024, 3, 31), date(2024, 4, 1)]
+    series = pack_series(start, days, [100, 250, 1999])
+    assert series["offsets"] is None
+    assert list(iterate_series(start, series)) == [
+        ("2024-03-30", 1.0),
+        ("2024-03-31", 2.5),
+        ("2024-04-01", 19.99),
+    ]
+
+
+def test_pack_series_with_gaps():
+    start = date(2024, 1, 1)
+    weeks = [date(2024, 1, 1), date(2024, 1, 8), date(2024, 1, 15)]
+    series = pack_series(start, weeks, [1, 2, 3])
+    assert series["offsets"] is not None
+    assert [label for label, value in iterate_series(start, series)] == [
+        "2024-01-01",
+        "2024-01-08",
+        "2024-01-15",
+    ]
+
+
+def test_pack_series_hours():
+    start = date(2024, 1, 1)
+    hours = [
+        datetime(2024, 1, 1, 22),
+        datetime(2024, 1, 1, 23),
+        datetime(2024, 1, 2, 0),
+    ]
+    series = pack_series(start, hours, [1, 2, 3])
+    assert series["offsets"] is not None  # the first hour is not at offset 0
+    assert list(iterate_series(start, series, hourly=True, places=0)) == [
+        ("2024-01-01 22:00", 1.0),
+        ("2024-01-01 23:00", 2.0),
+        ("2024-01-02 00:00", 3.0),
+    ]
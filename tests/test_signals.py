@@ -0,0 +1,50 @@
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from pretix.base.models import Order
+from pretix.base.signals import order_paid
+from pretix_stretchgoals.chart import get_filter_key, refresh_chart_and_text
+from pretix_stretchgoals.config import get_config
+from pretix_stretchgoals.models import DailyTotal
+from pretix_stretchgoals.utils import (
+    get_campaign_fresh_key, get_fresh_cache_key, set_campaigns,
+)
+
+from .utils import END, START, create_order, localize
+
+
+@pytest.mark.django_db
+def test_order_signal_marks_its_days_dirty(event, items, orders, locmem_cache):
+    event.settings.stretchgoals_chart_totals = True
+    event.settings.stretchgoals_start_date = START
+    event.settings.stretchgoals_end_date = END
+    campaign = {"id": 1, "name": {"en": "Campaign"}, "events": [event.pk], "goals": []}
+    set_campaigns(event.organizer, [campaign])
+    event.organizer.cache.set(get_campaign_fresh_key(campaign), True)
+    refresh_chart_and_text(event, force=True)
+    filter_key = get_filter_key(get_config(event))
+    rows = DailyTotal.objects.filter(event=event, filter_key=filter_key)
+    assert rows.count() == (END - START).days + 1
+    assert not rows.filter(dirty=True).exists()
+    assert event.cache.get(get_fresh_cache_key(event))
+
+    placed = START + timedelta(days=2)
+    paid = START + timedelta(days=5)
+    before = START - timedelta(days=3)  # not stored yet
+    order = create_order(
+        event,
+        Order.STATUS_PAID,
+        localize(placed, 10),
+        [(items[0], Decimal("10.00"))],
+        [localize(paid, 9), localize(before, 9)],
+    )
+    order_paid.send(event, order=order)
+
+    dirty = DailyTotal.objects.filter(event=event, filter_key=filter_key, dirty=True)
+    assert set(dirty.values_list("date", flat=True)) == {placed, paid, before}
+    assert set(
+        dirty.filter(date__in=(placed, paid)).values_list("generation", flat=True)
+    ) == {1}
+    assert event.cache.get(get_fresh_cache_key(event)) is None
+    assert event.cache.get(get_fresh_cache_key(event, public=True)) is None
+    assert event.organizer.cache.get(get_campaign_fresh_key(campaign)) is None
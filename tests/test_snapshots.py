@@ -0,0 +1,51 @@
+import pytest
+from datetime import timedelta
+from django.utils.timezone import now
+from pretix_stretchgoals.chart import get_filter_key
+from pretix_stretchgoals.config import get_config
+from pretix_stretchgoals.models import Snapshot
+from pretix_stretchgoals.payload import pack_values
+from pretix_stretchgoals.snapshots import (
+    diff_snapshots, get_previous_snapshot, get_snapshot_as_of,
+)
+
+from .utils import START
+
+
+def create_snapshot(event, filter_key, totals):
+    return Snapshot.objects.create(
+        event=event,
+        filter_key=filter_key,
+        start=START,
+        count=len(totals),
+        total=sum(totals),
+        counts=pack_values([1] * len(totals)),
+        totals=pack_values(totals),
+        digest=str(totals),
+    )
+
+
+@pytest.mark.django_db
+def test_snapshots_are_scoped_to_the_filter_key(event):
+    config = get_config(event)
+    filter_key = get_filter_key(config)
+    first = create_snapshot(event, filter_key, [100, 200])
+    other = create_snapshot(event, "other", [100])
+    latest = create_snapshot(event, filter_key, [100, 250])
+
+    assert get_previous_snapshot(latest) == first
+    assert get_previous_snapshot(other) is None
+    today = now().astimezone(config.timezone).date()
+    assert get_snapshot_as_of(event, today, config) == latest
+
+    rows = diff_snapshots(first, latest)
+    assert [row["date"] for row in rows] == [START + timedelta(days=1)]
+    assert diff_snapshots(other, latest) is None
+
+
+@pytest.mark.django_db
+def test_snapshot_as_of_ignores_other_filter_keys(event):
+    config = get_config(event)
+    create_snapshot(event, "other", [100])
+    today = now().astimezone(config.timezone).date()
+    assert get_snapshot_as_of(event, today, config) is None
@@ -0,0 +1,107 @@
+import json
+import pytest
+from django.urls import reverse
+from pretix.multidomain.urlreverse import eventreverse
+from pretix_stretchgoals.utils import set_goals
+
+
+@pytest.fixture
+def public_event(event, items):
+    event.live = True
+    event.save()
+    event.settings.stretchgoals_is_public = True
+    event.settings.stretchgoals_chart_totals = True
+    event.settings.stretchgoals_breakdown = True
+    return event
+
+
+@pytest.mark.django_db
+def test_async_data_matches_sync_data(client, public_event):
+    # Without a celery worker, the first request computes the data eagerly
+    response = client.get(
+        eventreverse(public_event, "plugins:pretix_stretchgoals:public.data")
+    )
+    assert response.status_code == 200
+    async_response = client.get(
+        reverse(
+            "plugins:pretix_stretchgoals:public.data.async",
+            kwargs={
+                "organizer": public_event.organizer.slug,
+                "event": public_event.slug,
+            },
+        )
+    )
+    assert async_response.status_code == 200
+    assert json.loads(async_response.content) == json.loads(response.content)
+    assert "breakdown" not in json.loads(response.content)
+
+
+def get_public_data(client, event, **headers):
+    return client.get(
+        eventreverse(event, "plugins:pretix_stretchgoals:public.data"), **headers
+    )
+
+
+@pytest.mark.django_db
+def test_public_text_is_hidden_until_significant(client, public_event):
+    public_event.settings.stretchgoals_public_text = "The average is {avg_now}"
+    public_event.settings.stretchgoals_min_orders = 10
+    data = json.loads(get_public_data(client, public_event).content)
+    assert data["significant"] is False
+    assert data["public_text"] is None
+    assert data["avg_now"] is None
+
+    public_event.settings.stretchgoals_min_orders = 0
+    public_event.cache.clear()
+    data = json.loads(get_public_data(client, public_event).content)
+    assert data["significant"] is True
+    assert data["public_text"].startswith("The average is")
+
+
+@pytest.mark.django_db
+def test_conditional_get(client, public_event):
+    response = get_public_data(client, public_event)
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    response = get_public_data(client, public_event, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert not response.content
+
+    response = get_public_data(
+        client, public_event, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+    )
+    assert response.status_code == 304
+
+    # The goals are only listed with the calculation text
+    public_event.settings.stretchgoals_calculation_text = True
+    response = get_public_data(client, public_event, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_widget_without_total_revenue_chart(client, public_event, orders):
+    public_event.settings.stretchgoals_chart_totals = False
+    public_event.settings.stretchgoals_chart_averages = True
+    public_event.settings.stretchgoals_calculation_text = True
+    set_goals(
+        public_event,
+        [
+            {
+                "name": {"en": "Goal"},
+                "description": {"en": ""},
+                "total": 1000,
+                "amount": 100,
+            }
+        ],
+    )
+    # 207.50 of the paid orders count towards the goal
+    response = client.get(
+        eventreverse(public_event, "plugins:pretix_stretchgoals:widget")
+    )
+    assert response.status_code == 200
+    assert "20 %" in response.content.decode()
+    data = json.loads(get_public_data(client, public_event).content)
+    assert data["goals"][0]["total_left"] == 792.5
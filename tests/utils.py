@@ -0,0 +1,90 @@
+import pytz
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pretix.base.models import Order, OrderPayment, OrderPosition
+from pretix_stretchgoals.chart import get_day_end, get_day_start
+
+TZ = pytz.timezone("Europe/Berlin")  # the timezone of the event fixture
+START = date(2024, 3, 4)
+END = date(2024, 3, 10)
+
+
+def localize(day, hour, minute=0):
+    return TZ.localize(datetime(day.year, day.month, day.day, hour, minute))
+
+
+def create_order(event, status, placed, positions, payment_dates=()):
+    order = Order.objects.create(
+        organizer=event.organizer,
+        event=event,
+        status=status,
+        datetime=placed,
+        expires=placed + timedelta(days=14),
+        total=sum(price for item, price in positions),
+        email="dummy@example.org",
+        sales_channel=event.organizer.sales_channels.get(identifier="web"),
+    )
+    for positionid, (item, price) in enumerate(positions, start=1):
+        OrderPosition.objects.create(
+            order=order, positionid=positionid, item=item, price=price
+        )
+    for local_id, payment_date in enumerate(payment_dates, start=1):
+        OrderPayment.objects.create(
+            order=order,
+            local_id=local_id,
+            amount=order.total,
+            provider="manual",
+            state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+            payment_date=payment_date,
+        )
+    return order
+
+
+def create_orders(event, items):
+    """
+    Create a few orders between START and END, some of them right at the
+    boundaries of a day.
+    """
+    ticket, workshop = items
+    day = [START + timedelta(days=offset) for offset in range(7)]
+    paid, pending = Order.STATUS_PAID, Order.STATUS_PENDING
+    create_order(
+        event,
+        paid,
+        localize(day[0], 10),
+        [(ticket, Decimal("23.00")), (workshop, Decimal("42.00"))],
+        [localize(day[1], 9)],
+    )
+    # Placed and paid right at the boundaries of a day
+    create_order(
+        event,
+        paid,
+        get_day_start(day[1], TZ),
+        [(ticket, Decimal("12.50"))],
+        [get_day_end(day[2], TZ)],
+    )
+    create_order(
+        event, pending, get_day_end(day[3], TZ), [(workshop, Decimal("42.00"))]
+    )
+    create_order(event, pending, localize(day[4], 12), [(ticket, Decimal("17.30"))])
+    create_order(
+        event,
+        paid,
+        localize(day[5], 8),
+        [(ticket, Decimal("99.99"))],
+        [get_day_start(day[6], TZ)],
+    )
+    create_order(
+        event,
+        Order.STATUS_CANCELED,
+        localize(day[3], 15),
+        [(ticket, Decimal("1000.00"))],
+    )
+    # Paid in two parts, counted on the day of the last payment
+    create_order(
+        event,
+        paid,
+        localize(day[2], 11),
+        [(workshop, Decimal("30.01"))],
+        [localize(day[2], 11), localize(day[4], 16)],
+    )